@@ -1,20 +1,97 @@
 import os
 import io
+import gc
+import sys
 import zipfile
-import webbrowser
+import re
+import json
+import time
+import uuid
+import random
+import socket
+import signal
+import argparse
+import traceback
+import hashlib
+import struct
+import contextlib
+import bisect
+import queue
+import shutil
+import tempfile
+import itertools
+import functools
+import collections
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from threading import Timer
-from flask import Flask, render_template_string, request, send_file
-import PyPDF2
+from flask import Flask, Request, Response, current_app, g, has_request_context, jsonify, render_template_string, request, send_file, stream_with_context
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from werkzeug.serving import make_server
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 from PIL import Image
 
-# You will need to install Flask, PyPDF2, and Pillow:
-# pip install Flask PyPDF2 Pillow
+# You will need to install Flask and Pillow:
+# pip install Flask Pillow
+
+class ConverterRequest(Request):
+    """Lets the background job endpoint accept larger uploads than the synchronous form."""
+    @property
+    def max_content_length(self):
+        if not current_app:
+            return None
+        if self.url_rule is not None and self.url_rule.endpoint == 'submit_job':
+            return current_app.config['JOB_MAX_CONTENT_LENGTH']
+        return current_app.config['MAX_CONTENT_LENGTH']
+
+    @property
+    def max_form_parts(self):
+        if current_app and self.url_rule is not None and self.url_rule.endpoint == 'submit_job':
+            return current_app.config['JOB_MAX_FORM_PARTS']
+        return super().max_form_parts
 
 # Configure the Flask application
 app = Flask(__name__)
+app.request_class = ConverterRequest
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024  # 32 MB max file size for multiple images
+app.config['STREAM_ZIP'] = True  # Send each PDF to the browser as soon as it is encoded
+app.config['STREAM_UPLOADS'] = True  # Start converting each image as soon as its part of the upload arrives
+app.config['STREAM_CHUNK_SIZE'] = 64 * 1024  # Bytes read from the upload at a time when streaming
+app.config['CONVERT_WORKERS'] = os.cpu_count() or 1  # Worker processes per batch; 1 converts on the request thread
+app.config['PDF_RESOLUTION'] = 100.0  # Pixels per inch used to size the PDF pages
+app.config['JPEG_PASSTHROUGH'] = True  # Embed JPEG data in the PDF without decoding it
+app.config['SERVER_MAX_REQUESTS'] = 1000  # Requests a pre-forked worker serves before it is replaced
+app.config['METRICS_FOLDER'] = None  # Directory where pre-forked workers publish their metrics; serve() creates one
+app.config['SERVER_TIMING'] = False  # Add a Server-Timing header to every response, not just ?timing=1
+app.config['PAGE_SIZE'] = 'original'  # Default page size, one of PAGE_SIZES or 'original'
+app.config['TARGET_DPI'] = None  # Default maximum pixels per inch of the output; None keeps every pixel
+app.config['MAX_TARGET_DPI'] = 1200  # Highest DPI a request may ask for
+# Cache of converted PDFs, keyed by image content and conversion options
+app.config['CACHE_FOLDER'] = 'cache'
+app.config['CACHE_MEMORY_BYTES'] = 64 * 1024 * 1024  # 64 MB kept in memory
+app.config['CACHE_DISK_BYTES'] = 1024 * 1024 * 1024  # 1 GB kept on disk
+# Background conversion jobs
+app.config['JOB_WORKERS'] = 2  # Jobs converted at the same time
+app.config['JOB_QUEUE_SIZE'] = 8  # Jobs allowed to wait; further submissions get 429
+app.config['JOB_TTL'] = 60 * 60  # Seconds a finished job and its archive are kept
+app.config['JOB_MAX_AGE'] = 24 * 60 * 60  # Seconds after which an unfinished job counts as abandoned
+app.config['JOB_MAX_CONTENT_LENGTH'] = 1024 * 1024 * 1024  # 1 GB max upload for a job
+app.config['JOB_MAX_FORM_PARTS'] = 100000  # Most files and fields a job upload may contain
+
+# File extensions accepted by the converter
+ALLOWED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+# Page sizes in inches (portrait); images are fitted inside them
+PAGE_SIZES = {
+    'a3': (11.69, 16.54),
+    'a4': (8.27, 11.69),
+    'a5': (5.83, 8.27),
+    'letter': (8.5, 11.0),
+    'legal': (8.5, 14.0),
+}
 
 # HTML for the web interface
 HTML_TEMPLATE = """
@@ -39,8 +116,26 @@ HTML_TEMPLATE = """
 <body class="bg-gray-100 p-8">
     <div class="bg-white p-8 rounded-2xl shadow-xl max-w-lg w-full text-center">
         <h1 class="text-3xl font-bold text-gray-800 mb-4">Image to PDFs Converter</h1>
-        <p class="text-gray-600 mb-6">Upload one or more images to convert each into a separate PDF file.</p>
+        <p class="text-gray-600 mb-6">Upload one or more images to convert each into a separate PDF file, or merge them into one document.</p>
         <form action="/convert_images" method="post" enctype="multipart/form-data" class="space-y-4">
+            <div class="flex justify-center space-x-4 text-gray-700">
+                <select name="page_size" class="border rounded-lg p-2">
+                    <option value="original">Original size</option>
+                    <option value="a4">A4</option>
+                    <option value="letter">Letter</option>
+                </select>
+                <input type="number" name="dpi" min="1" placeholder="Max DPI" class="border rounded-lg p-2 w-28">
+            </div>
+            <div class="flex justify-center space-x-4 text-gray-700">
+                <select name="output" class="border rounded-lg p-2">
+                    <option value="zip">One PDF per image (ZIP)</option>
+                    <option value="merged">Single PDF document</option>
+                </select>
+                <select name="page_order" class="border rounded-lg p-2">
+                    <option value="upload">Upload order</option>
+                    <option value="name">Sort by filename</option>
+                </select>
+            </div>
             <div class="flex flex-col items-center justify-center">
                 <label for="images" class="block text-gray-700 font-medium mb-2">Select Image Files:</label>
                 <input type="file" name="images" id="images" accept="image/*" multiple
@@ -71,47 +166,1122 @@ def index():
     """Renders the main page with the file upload form."""
     return render_template_string(HTML_TEMPLATE)
 
-@app.route('/convert_images', methods=['POST'])
-def convert_images_to_pdf():
-    """Handles the image file uploads and conversion process."""
-    if 'images' not in request.files:
-        return render_template_string(HTML_TEMPLATE, message="Error: No image files part in the request.")
+class ChunkSink:
+    """
+    A write-only file object that collects what is written to it, so a generator
+    can pass it on to the client. Because it cannot seek, zipfile writes each
+    entry followed by a data descriptor, so every entry can be sent as soon as
+    it has been added.
+    """
+    def __init__(self):
+        self._chunks = []
 
-    files = request.files.getlist('images')
-    if not files or all(file.filename == '' for file in files):
-        return render_template_string(HTML_TEMPLATE, message="Error: No selected files.")
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Returns the bytes written since the last call and forgets them."""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+# --- Metrics ---
+# Conversion stages are timed for every upload. Worker processes return their
+# timings with each result and the serving process keeps the histograms, which
+# /metrics exposes in the Prometheus text format.
+STAGES = ('multipart_parse', 'decode', 'convert', 'pdf_save', 'zip_write')
+# Upper bounds, in seconds, of the histogram buckets
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REQUEST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+METRICS_PREFIX = 'bulkjpgtopdf'
+METRICS_FLUSH_INTERVAL = 1.0  # Seconds between writes of a pre-forked worker's metrics file
+
+class Histogram:
+    """A cumulative histogram with fixed buckets, as Prometheus expects them."""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def exposition(self, name, labels):
+        """Returns the _bucket, _sum and _count lines of the histogram."""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{format_labels(labels, le=le)} {cumulative}')
+        lines.append(f'{name}_sum{format_labels(labels)} {self.sum!r}')
+        lines.append(f'{name}_count{format_labels(labels)} {self.count}')
+        return lines
+
+    def state(self):
+        return [list(self.counts), self.sum, self.count]
+
+    @classmethod
+    def from_state(cls, buckets, state):
+        histogram = cls(buckets)
+        histogram.counts, histogram.sum, histogram.count = state
+        return histogram
+
+class ConversionError(collections.namedtuple('ConversionError', 'reason message')):
+    """Why an image could not be converted. Prints as the message; the reason labels the failure metric."""
+    __slots__ = ()
+
+    def __str__(self):
+        return self.message
+
+metrics_lock = threading.Lock()
+stage_seconds = {stage: Histogram(STAGE_BUCKETS) for stage in STAGES}
+request_seconds = collections.defaultdict(lambda: Histogram(REQUEST_BUCKETS))  # endpoint -> histogram
+requests_total = collections.Counter()  # (endpoint, status) -> count
+failures_total = collections.Counter()  # reason -> count
+bytes_total = collections.Counter()  # 'upload', 'pdf' or 'zip' -> bytes
+requests_in_flight = 0
+
+def format_labels(labels, **extra):
+    """Formats a Prometheus label set such as {stage="decode",le="0.1"}."""
+    items = {**labels, **extra}
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in items.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(items, escaped)) + '}'
+
+@contextlib.contextmanager
+def timed(timings, stage):
+    """Adds the seconds spent in the with-block to timings[stage]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+def record_stages(timings):
+    """
+    Adds the stage timings of one conversion to the histograms, and to the
+    Server-Timing totals of the current request if there is one.
+    """
+    with metrics_lock:
+        for stage, seconds in timings.items():
+            stage_seconds[stage].observe(seconds)
+    if has_request_context():
+        request_timings = g.setdefault('stage_timings', {})
+        for stage, seconds in timings.items():
+            request_timings[stage] = request_timings.get(stage, 0.0) + seconds
+
+@contextlib.contextmanager
+def timed_stage(stage):
+    """Times the with-block as one run of `stage` in the serving process."""
+    timings = {}
+    with timed(timings, stage):
+        yield
+    record_stages(timings)
+
+def count_bytes(kind, amount):
+    """Adds to one of the byte counters."""
+    with metrics_lock:
+        bytes_total[kind] += amount
+
+def count_failure(reason):
+    """Counts a failed conversion or rejected request."""
+    with metrics_lock:
+        failures_total[reason] += 1
+
+def stage_stats_snapshot(reset=False):
+    """Returns {stage: {'count': n, 'seconds': total}}, optionally zeroing the histograms."""
+    with metrics_lock:
+        snapshot = {stage: {'count': h.count, 'seconds': h.sum} for stage, h in stage_seconds.items()}
+        if reset:
+            for stage in STAGES:
+                stage_seconds[stage] = Histogram(STAGE_BUCKETS)
+    return snapshot
+
+@app.before_request
+def start_request_metrics():
+    """Counts the request as in flight."""
+    global requests_in_flight
+    g.request_start = time.perf_counter()
+    with metrics_lock:
+        requests_in_flight += 1
+
+@app.after_request
+def add_server_timing(response):
+    """
+    Arranges for the request to be counted once the response is closed and, when
+    SERVER_TIMING is on or the request has ?timing=1, adds a Server-Timing header
+    with the stage times. Streamed responses send their headers first, so they
+    only include the stages finished before the first chunk.
+    """
+    # The server closes the response after sending it, so a streamed body is included
+    response.call_on_close(functools.partial(
+        finish_request_metrics, g._get_current_object(), request.endpoint, response.status_code))
+    g.metrics_deferred = True
+    if app.config['SERVER_TIMING'] or request.args.get('timing') == '1':
+        timings = g.get('stage_timings', {})
+        response.headers['Server-Timing'] = ', '.join(
+            f'{stage};dur={timings[stage] * 1000:.1f}' for stage in STAGES if stage in timings)
+    return response
+
+@app.teardown_request
+def note_request_failure(exc):
+    """
+    Marks a request whose view or streamed body raised. A request that never got
+    a response to close is recorded here instead.
+    """
+    if exc is not None:
+        g.request_failed = True
+    if not g.get('metrics_deferred'):
+        finish_request_metrics(g._get_current_object(), request.endpoint, 500)
+
+def finish_request_metrics(request_globals, endpoint, status):
+    """
+    Records a finished request. Flask tears a streamed request down twice, so
+    only the first call for a request counts.
+    """
+    global requests_in_flight
+    start = request_globals.pop('request_start', None)
+    if start is None:
+        return
+    if request_globals.get('request_failed'):
+        status = 500
+    with metrics_lock:
+        requests_in_flight -= 1
+        requests_total[(endpoint or 'unknown', status)] += 1
+        request_seconds[endpoint or 'unknown'].observe(time.perf_counter() - start)
+
+def metrics_state():
+    """Returns the metrics of this process as plain data that can be stored as JSON and merged."""
+    with metrics_lock:
+        state = {
+            'stage_seconds': {stage: histogram.state() for stage, histogram in stage_seconds.items()},
+            'request_seconds': {endpoint: histogram.state() for endpoint, histogram in request_seconds.items()},
+            'requests_total': [[endpoint, status, count] for (endpoint, status), count in requests_total.items()],
+            'failures_total': dict(failures_total),
+            'bytes_total': dict(bytes_total),
+            'requests_in_flight': requests_in_flight,
+        }
+    cache_stats = get_pdf_cache().snapshot()
+    state['cache_events_total'] = {event: cache_stats[event] for event in CACHE_COUNTERS}
+    return state
+
+def merge_metrics(states):
+    """Adds up the metrics states of several processes into one state."""
+    total = {'stage_seconds': {}, 'request_seconds': {}, 'requests_in_flight': 0}
+    requests = collections.Counter()
+    counters = {kind: collections.Counter() for kind in ('failures_total', 'bytes_total', 'cache_events_total')}
+    for state in states:
+        for kind in ('stage_seconds', 'request_seconds'):
+            for key, (counts, seconds, count) in state[kind].items():
+                merged = total[kind].setdefault(key, [[0] * len(counts), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += seconds
+                merged[2] += count
+        for endpoint, status, count in state['requests_total']:
+            requests[(endpoint, status)] += count
+        for kind, counter in counters.items():
+            counter.update(state[kind])
+        total['requests_in_flight'] += state['requests_in_flight']
+    total['requests_total'] = [[endpoint, status, count] for (endpoint, status), count in requests.items()]
+    total.update((kind, dict(counter)) for kind, counter in counters.items())
+    return total
+
+# --- Metrics of pre-forked workers ---
+# Each worker writes its metrics to worker-<pid>.json in METRICS_FOLDER, and
+# /metrics in any worker adds up every file there. When a worker exits, the
+# parent folds its file into retired.json, so totals never go backwards.
+
+@contextlib.contextmanager
+def metrics_folder_lock(exclusive):
+    """Keeps a worker's file from being retired while /metrics is reading the folder."""
+    # Only pre-forked serving shares a metrics folder, and it needs POSIX anyway
+    import fcntl
+    with open(os.path.join(app.config['METRICS_FOLDER'], '.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+def worker_metrics_path(pid):
+    return os.path.join(app.config['METRICS_FOLDER'], f'worker-{pid}.json')
+
+def write_metrics_file(path, state):
+    # The flushing thread and the request loop may both be writing
+    temp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_path, path)
+
+def read_metrics_file(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def publish_worker_metrics():
+    """Writes this worker's metrics where the other workers can add them up."""
+    write_metrics_file(worker_metrics_path(os.getpid()), metrics_state())
+
+def publish_worker_metrics_loop():
+    """Keeps this worker's metrics file current while job threads convert between requests."""
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        publish_worker_metrics()
+
+def retire_worker_metrics(pid):
+    """Folds the metrics file of a worker that exited into retired.json."""
+    path = worker_metrics_path(pid)
+    retired_path = os.path.join(app.config['METRICS_FOLDER'], 'retired.json')
+    with metrics_folder_lock(exclusive=True):
+        state = read_metrics_file(path)
+        if state is None:
+            return
+        retired = read_metrics_file(retired_path)
+        merged = merge_metrics([state] + ([retired] if retired else []))
+        # An exited worker has nothing in flight, even if it died mid-request
+        merged['requests_in_flight'] = 0
+        write_metrics_file(retired_path, merged)
+        os.remove(path)
+
+def all_workers_metrics():
+    """Returns the metrics of every live and retired worker, added up."""
+    folder = app.config['METRICS_FOLDER']
+    with metrics_folder_lock(exclusive=False):
+        states = [read_metrics_file(os.path.join(folder, name))
+                  for name in os.listdir(folder) if name.endswith('.json')]
+    return merge_metrics(state for state in states if state is not None)
+
+@app.route('/metrics')
+def metrics():
+    """
+    Exposes the counters and histograms in the Prometheus text format. With
+    pre-forked workers they cover all of them, not just the one answering.
+    """
+    if app.config['METRICS_FOLDER']:
+        publish_worker_metrics()
+        state = all_workers_metrics()
+    else:
+        state = metrics_state()
+
+    p = METRICS_PREFIX
+    lines = [f'# HELP {p}_stage_seconds Time spent in each conversion stage.',
+             f'# TYPE {p}_stage_seconds histogram']
+    for stage, histogram in state['stage_seconds'].items():
+        lines += Histogram.from_state(STAGE_BUCKETS, histogram).exposition(f'{p}_stage_seconds', {'stage': stage})
+
+    lines += [f'# HELP {p}_request_seconds Time to handle a request, including a streamed body.',
+              f'# TYPE {p}_request_seconds histogram']
+    for endpoint, histogram in sorted(state['request_seconds'].items()):
+        lines += Histogram.from_state(REQUEST_BUCKETS, histogram).exposition(
+            f'{p}_request_seconds', {'endpoint': endpoint})
+
+    lines += [f'# HELP {p}_requests_total Requests handled, by endpoint and status.',
+              f'# TYPE {p}_requests_total counter']
+    for endpoint, status, count in sorted(state['requests_total']):
+        lines.append(f'{p}_requests_total{format_labels({"endpoint": endpoint, "status": status})} {count}')
+
+    lines += [f'# HELP {p}_requests_in_flight Requests being handled right now.',
+              f'# TYPE {p}_requests_in_flight gauge',
+              f'{p}_requests_in_flight {state["requests_in_flight"]}']
+
+    lines += [f'# HELP {p}_failures_total Failed conversions and rejected requests, by reason.',
+              f'# TYPE {p}_failures_total counter']
+    for reason, count in sorted(state['failures_total'].items()):
+        lines.append(f'{p}_failures_total{format_labels({"reason": reason})} {count}')
+
+    lines += [f'# HELP {p}_bytes_total Uploaded image bytes, converted PDF bytes and ZIP bytes sent.',
+              f'# TYPE {p}_bytes_total counter']
+    for kind, amount in sorted(state['bytes_total'].items()):
+        lines.append(f'{p}_bytes_total{format_labels({"kind": kind})} {amount}')
+
+    lines += [f'# HELP {p}_cache_events_total PDF cache hits, misses and evictions.',
+              f'# TYPE {p}_cache_events_total counter']
+    for event in CACHE_COUNTERS:
+        lines.append(f'{p}_cache_events_total{format_labels({"event": event})} {state["cache_events_total"].get(event, 0)}')
+
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+# Settings that change the converted output; passed to the worker processes with every image
+ConversionOptions = collections.namedtuple('ConversionOptions', 'resolution jpeg_passthrough page_size dpi')
+
+def conversion_options(form=None):
+    """
+    Builds the conversion options from the app configuration and the optional
+    page_size and dpi fields of a submitted form. Raises ValueError with a
+    message for the user if a field is invalid.
+    """
+    form = form or {}
+    page_size = form.get('page_size') or app.config['PAGE_SIZE']
+    if page_size != 'original' and page_size not in PAGE_SIZES:
+        raise ValueError(f"Unknown page size '{page_size}'.")
+
+    dpi = form.get('dpi') or app.config['TARGET_DPI']
+    if dpi is not None:
+        try:
+            dpi = float(dpi)
+        except ValueError:
+            raise ValueError("The DPI must be a number.")
+        if not 0 < dpi <= app.config['MAX_TARGET_DPI']:
+            raise ValueError(f"The DPI must be between 1 and {app.config['MAX_TARGET_DPI']}.")
+
+    return ConversionOptions(
+        resolution=app.config['PDF_RESOLUTION'],
+        jpeg_passthrough=app.config['JPEG_PASSTHROUGH'],
+        page_size=page_size,
+        dpi=dpi,
+    )
+
+def page_layout(width, height, options):
+    """
+    Works out how a `width` x `height` pixel image is placed on its page.
+    Returns (width, height, resolution, page): the pixel size to convert the
+    image at, which is never larger than the original, the pixels per inch that
+    make the image come out at the size it fills on the page, and the page size
+    in points, or None when the page is the size of the image.
+    """
+    page = None
+    if options.page_size in PAGE_SIZES:
+        page_width, page_height = PAGE_SIZES[options.page_size]
+        if width > height:
+            page_width, page_height = page_height, page_width
+        inches_per_pixel = min(page_width / width, page_height / height)
+        page = (page_width * 72.0, page_height * 72.0)
+    else:
+        inches_per_pixel = 1.0 / options.resolution
+    image_width = width * inches_per_pixel
+
+    if options.dpi:
+        scale = min(1.0, options.dpi * inches_per_pixel)
+        width = max(1, round(width * scale))
+        height = max(1, round(height * scale))
+    return width, height, width / image_width, page
+
+def decode_image(data, options, timings):
+    """
+    Opens an image and decodes only the pixels the page needs. JPEGs are decoded
+    at a reduced scale where possible before the final resampling.
+    Returns the RGB image, the resolution to save it at and its page size.
+    """
+    with timed(timings, 'decode'):
+        img = Image.open(io.BytesIO(data))
+        width, height, resolution, page = page_layout(img.width, img.height, options)
+        if (width, height) != img.size:
+            # Lets the JPEG decoder scale by 1/2, 1/4 or 1/8 while decoding
+            img.draft('RGB', (width, height))
+        img.load()
+    with timed(timings, 'convert'):
+        img = img.convert('RGB')
+        if img.size != (width, height):
+            img = img.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+    return img, resolution, page
+
+def passthrough_layout(data, options, timings):
+    """
+    Returns (JpegInfo, resolution, page) if `data` is a JPEG that can be embedded
+    as-is at the requested size, or None if it has to be decoded.
+    """
+    if not options.jpeg_passthrough:
+        return None
+    with timed(timings, 'decode'):
+        jpeg = read_jpeg_header(data)
+    if jpeg is None:
+        return None
+    width, height, resolution, page = page_layout(jpeg.width, jpeg.height, options)
+    if (width, height) != (jpeg.width, jpeg.height):
+        # Larger than the target DPI needs
+        return None
+    return jpeg, resolution, page
+
+JpegInfo = collections.namedtuple('JpegInfo', 'width height components')
+
+# Start-of-frame markers for baseline, extended sequential and progressive Huffman JPEGs
+PASSTHROUGH_SOF_MARKERS = (0xC0, 0xC1, 0xC2)
+
+def read_jpeg_header(data):
+    """
+    Reads the size and component count of a JPEG from its header, without
+    decoding it. Returns None if the data is not an 8-bit grayscale or YCbCr
+    JPEG that a PDF viewer can display as-is.
+    """
+    if data[:3] != b'\xff\xd8\xff':
+        return None
+
+    adobe_transform = None
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # Markers without a length field
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            # Reached the image data (or the end) without a usable frame header
+            return None
+
+        length = int.from_bytes(data[pos + 2:pos + 4], 'big')
+        segment = data[pos + 4:pos + 2 + length]
+
+        if marker == 0xEE and segment[:5] == b'Adobe' and len(segment) >= 12:
+            adobe_transform = segment[11]
+        elif 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            # Lossless, hierarchical and arithmetic-coded JPEGs go through Pillow
+            if marker not in PASSTHROUGH_SOF_MARKERS or len(segment) < 6:
+                return None
+            precision = segment[0]
+            height = int.from_bytes(segment[1:3], 'big')
+            width = int.from_bytes(segment[3:5], 'big')
+            components = segment[5]
+            if precision != 8 or not width or not height or components not in (1, 3):
+                return None
+            if components == 3 and adobe_transform == 0:
+                # RGB stored without the YCbCr transform
+                return None
+            if data.rfind(b'\xff\xd9') < pos:
+                # Truncated file
+                return None
+            return JpegInfo(width, height, components)
+
+        pos += 2 + length
+    return None
+
+# Magic bytes of the accepted image formats
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+    (b'BM', 'BMP'),
+)
+
+# Sizes of the BMP info headers Pillow reads
+BMP_HEADER_SIZES = (12, 40, 52, 56, 64, 108, 124)
+
+def sniff_image(data):
+    """
+    Identifies an upload by its magic bytes and checks that its header is
+    complete and describes a sensible image, without decoding anything.
+    Returns (format, width, height); raises ValueError otherwise.
+    """
+    image_format = next((name for signature, name in IMAGE_SIGNATURES if data.startswith(signature)), None)
+    if image_format is None:
+        raise ValueError("not a JPEG, PNG, GIF or BMP image")
+
+    if image_format == 'JPEG':
+        width, height = _jpeg_frame_size(data)
+    elif image_format == 'PNG':
+        if len(data) < 24 or data[12:16] != b'IHDR':
+            raise ValueError("PNG header is missing")
+        width, height = struct.unpack('>II', data[16:24])
+    elif image_format == 'GIF':
+        if len(data) < 13:
+            raise ValueError("GIF header is truncated")
+        width, height = struct.unpack('<HH', data[6:10])
+    else:
+        if len(data) < 26:
+            raise ValueError("BMP header is truncated")
+        header_size = struct.unpack('<I', data[14:18])[0]
+        if header_size not in BMP_HEADER_SIZES:
+            raise ValueError(f"unknown BMP header size {header_size}")
+        if header_size == 12:
+            width, height = struct.unpack('<HH', data[18:22])
+        else:
+            width, height = struct.unpack('<ii', data[18:26])
+            # Negative heights are stored top-down
+            height = abs(height)
+
+    if width <= 0 or height <= 0:
+        raise ValueError(f"{image_format} header gives an empty image")
+    if Image.MAX_IMAGE_PIXELS and width * height > 2 * Image.MAX_IMAGE_PIXELS:
+        # Pillow would refuse to decode it anyway
+        raise ValueError(f"{image_format} image is too large ({width}x{height})")
+    return image_format, width, height
+
+def _jpeg_frame_size(data):
+    """Returns the size from a JPEG's frame header; raises ValueError if there is none before the image data."""
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ValueError("JPEG markers are corrupt")
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            raise ValueError("JPEG has no frame header")
+        length = int.from_bytes(data[pos + 2:pos + 4], 'big')
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if pos + 9 > len(data):
+                break
+            height = int.from_bytes(data[pos + 5:pos + 7], 'big')
+            width = int.from_bytes(data[pos + 7:pos + 9], 'big')
+            return width, height
+        pos += 2 + length
+    raise ValueError("JPEG header is truncated")
+
+class PdfWriter:
+    """
+    Writes a PDF made of JPEG pages. Each page is written to `out` as soon as it
+    is added and only the object offsets are kept, so `out` does not have to be
+    seekable and the pages never need to be in memory together.
+    """
+    def __init__(self, out):
+        self._out = out
+        self._offset = 0
+        self._offsets = {}  # object number -> byte offset
+        self._page_numbers = []
+        # Object 1 is the catalog and object 2 the page tree; both are written by close()
+        self._next_number = 3
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, data):
+        self._out.write(data)
+        self._offset += len(data)
+
+    def _allocate(self):
+        number = self._next_number
+        self._next_number += 1
+        return number
+
+    def _write_object(self, number, dictionary, stream=None):
+        self._offsets[number] = self._offset
+        self._write(f'{number} 0 obj\n{dictionary}'.encode('ascii'))
+        if stream is not None:
+            self._write(b'\nstream\n')
+            self._write(stream)
+            self._write(b'\nendstream')
+        self._write(b'\nendobj\n')
+
+    def add_jpeg_page(self, data, width, height, components, resolution, page=None):
+        """
+        Adds a page showing the JPEG `data`, sized at `resolution` pixels per inch.
+        The page is `page` (width, height) points with the image centred on it,
+        or the size of the image when `page` is None.
+        """
+        image_number = self._allocate()
+        contents_number = self._allocate()
+        page_number = self._allocate()
+
+        colour_space = '/DeviceRGB' if components == 3 else '/DeviceGray'
+        self._write_object(
+            image_number,
+            f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+            f'/ColorSpace {colour_space} /BitsPerComponent 8 /Filter /DCTDecode /Length {len(data)} >>',
+            data)
+
+        image_width = width * 72.0 / resolution
+        image_height = height * 72.0 / resolution
+        page_width, page_height = page or (image_width, image_height)
+        x = (page_width - image_width) / 2
+        y = (page_height - image_height) / 2
+        contents = f'q {image_width:.4f} 0 0 {image_height:.4f} {x:.4f} {y:.4f} cm /Im0 Do Q'.encode('ascii')
+        self._write_object(contents_number, f'<< /Length {len(contents)} >>', contents)
+
+        self._write_object(
+            page_number,
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.4f} {page_height:.4f}] '
+            f'/Resources << /XObject << /Im0 {image_number} 0 R >> >> /Contents {contents_number} 0 R >>')
+        self._page_numbers.append(page_number)
+
+    def close(self):
+        """Writes the page tree, catalog and cross-reference table."""
+        kids = ' '.join(f'{number} 0 R' for number in self._page_numbers)
+        self._write_object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self._page_numbers)} >>')
+        self._write_object(1, '<< /Type /Catalog /Pages 2 0 R >>')
+
+        xref_offset = self._offset
+        size = self._next_number
+        xref = [f'xref\n0 {size}\n', '0000000000 65535 f \n']
+        xref += [f'{self._offsets[number]:010d} 00000 n \n' for number in range(1, size)]
+        xref.append(f'trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n')
+        self._write(''.join(xref).encode('ascii'))
+
+def jpeg_page(data, options, timings):
+    """
+    Returns (jpeg_data, width, height, components, resolution, page) for the page
+    of one image, as PdfWriter.add_jpeg_page takes them. The JPEG data is the
+    upload itself when it can be embedded as-is, otherwise the image re-encoded
+    by Pillow the same way its PDF writer encodes RGB images.
+    """
+    passthrough = passthrough_layout(data, options, timings)
+    if passthrough is not None:
+        # Wrap the original JPEG stream instead of decoding and re-compressing it
+        jpeg, resolution, page = passthrough
+        return data, jpeg.width, jpeg.height, jpeg.components, resolution, page
+
+    img, resolution, page = decode_image(data, options, timings)
+    with timed(timings, 'pdf_save'):
+        jpeg_output = io.BytesIO()
+        img.save(jpeg_output, "JPEG")
+    return jpeg_output.getvalue(), img.width, img.height, 3, resolution, page
+
+def convert_image_to_pdf(data, options, timings=None):
+    """
+    Converts the bytes of one image into the bytes of a single-page PDF. The time
+    spent in each stage is added to the `timings` dict if one is given.
+    """
+    timings = {} if timings is None else timings
+    page = jpeg_page(data, options, timings)
+    pdf_output = io.BytesIO()
+    with timed(timings, 'pdf_save'):
+        writer = PdfWriter(pdf_output)
+        writer.add_jpeg_page(*page)
+        writer.close()
+    return pdf_output.getvalue()
+
+# Size, colour components, resolution and page size (0 x 0 for the image's own
+# size) stored in front of the JPEG data of a merged page
+PAGE_HEADER = struct.Struct('>IIBddd')
+
+def pack_page(jpeg_data, width, height, components, resolution, page=None):
+    """Bundles the JPEG data of a merged page with what PdfWriter needs to place it."""
+    page_width, page_height = page or (0.0, 0.0)
+    return PAGE_HEADER.pack(width, height, components, resolution, page_width, page_height) + jpeg_data
+
+def unpack_page(page):
+    """Splits a packed page into (jpeg_data, width, height, components, resolution, page)."""
+    width, height, components, resolution, page_width, page_height = PAGE_HEADER.unpack_from(page)
+    return (memoryview(page)[PAGE_HEADER.size:], width, height, components, resolution,
+            (page_width, page_height) if page_width else None)
+
+def convert_image_to_page(data, options, timings=None):
+    """Returns one packed page of a merged PDF."""
+    timings = {} if timings is None else timings
+    return pack_page(*jpeg_page(data, options, timings))
+
+def natural_sort_key(filename):
+    """Sort key that orders 'page2' before 'page10'."""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', filename)]
+
+# Page orders offered for the uploaded images
+PAGE_ORDERS = {
+    'upload': None,
+    'name': lambda file: natural_sort_key(file.filename),
+}
+
+def order_files(files, page_order):
+    """Returns the uploaded files in the requested page order."""
+    key = PAGE_ORDERS.get(page_order)
+    return sorted(files, key=key) if key else list(files)
+
+def pdf_filename_for(filename):
+    """Creates a safe PDF filename from the name of the uploaded image."""
+    base_name = os.path.splitext(secure_filename(filename))[0]
+    return f'{base_name}.pdf'
+
+def read_file(path):
+    """Returns the contents of a file."""
+    with open(path, 'rb') as f:
+        return f.read()
+
+# Process pool shared by all requests, created on first use
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Returns the shared conversion process pool, or None when conversion runs inline."""
+    global _executor
+    workers = app.config['CONVERT_WORKERS']
+    if workers <= 1:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers)
+        return _executor
+
+def discard_executor(executor):
+    """Drops a pool whose worker died so the next batch starts a fresh one."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def convert_upload(data, options):
+    """
+    Converts the raw bytes of one upload. Runs in a worker process, so errors are
+    returned as a ConversionError instead of being raised, along with the stage
+    timings: (pdf_bytes, None, timings) or (None, error, timings).
+    """
+    timings = {}
+    try:
+        return convert_image_to_pdf(data, options, timings), None, timings
+    except Exception as e:
+        return None, ConversionError(type(e).__name__, str(e)), timings
+
+def convert_upload_page(data, options):
+    """Like convert_upload, but returns a packed page of a merged PDF."""
+    timings = {}
+    try:
+        return convert_image_to_page(data, options, timings), None, timings
+    except Exception as e:
+        return None, ConversionError(type(e).__name__, str(e)), timings
+
+class PdfCache:
+    """
+    Content-addressed cache of converted PDFs, keyed by a hash of the image bytes
+    and the conversion options. A memory tier sits in front of a disk tier and
+    both evict their least recently used entries to stay under a byte limit.
+    A limit of 0 turns a tier off.
+    """
+    def __init__(self, memory_limit, disk_limit, folder):
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self.folder = folder
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()  # key -> pdf bytes
+        self._memory_bytes = 0
+        self._disk = None  # key -> file size, read from the folder on first use
+        self._disk_bytes = 0
+
+    # Part of every key; bump it when the converted output changes so old entries are not reused
+    FORMAT = 2
+
+    @staticmethod
+    def key(data, options, kind):
+        """Returns the cache key for converting `data` to `kind` output with `options`."""
+        digest = hashlib.sha256(data)
+        digest.update(repr((PdfCache.FORMAT, kind) + tuple(options)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, f'{key}.pdf')
+
+    def _load_disk_index(self):
+        """Lists the cached files, least recently used first. Called with the lock held."""
+        self._disk = collections.OrderedDict()
+        if not self.disk_limit:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith('.pdf'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _remember(self, key, pdf_bytes):
+        """Adds an entry to the memory tier. Called with the lock held."""
+        if len(pdf_bytes) > self.memory_limit or key in self._memory:
+            return
+        self._memory[key] = pdf_bytes
+        self._memory_bytes += len(pdf_bytes)
+        while self._memory_bytes > self.memory_limit:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.stats['memory_evictions'] += 1
 
-    images_to_convert = []
-    
-    for file in files:
-        if file and file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
+    def get(self, key):
+        """Returns the cached PDF bytes for `key`, or None."""
+        with self._lock:
+            pdf_bytes = self._memory.get(key)
+            if pdf_bytes is not None:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return pdf_bytes
+            if self._disk is None:
+                self._load_disk_index()
+            on_disk = key in self._disk
+
+        if on_disk:
             try:
-                img = Image.open(file)
-                img = img.convert('RGB')
-                images_to_convert.append((img, file.filename))
-            except Exception as e:
-                print(f"Failed to process image {file.filename}: {e}")
+                pdf_bytes = read_file(self._path(key))
+                # The modification time doubles as the last use time after a restart
+                os.utime(self._path(key))
+            except OSError:
+                # Evicted by another request in the meantime
+                pdf_bytes = None
 
-    if not images_to_convert:
-        return render_template_string(HTML_TEMPLATE, message="Error: No valid image files were uploaded.")
+        with self._lock:
+            if pdf_bytes is None:
+                self.stats['misses'] += 1
+                return None
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            self.stats['disk_hits'] += 1
+            self._remember(key, pdf_bytes)
+            return pdf_bytes
+
+    def put(self, key, pdf_bytes):
+        """Stores a converted PDF in both tiers."""
+        with self._lock:
+            self._remember(key, pdf_bytes)
+            if self._disk is None:
+                self._load_disk_index()
+            store_on_disk = len(pdf_bytes) <= self.disk_limit and key not in self._disk
+
+        if not store_on_disk:
+            return
+        path = self._path(key)
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(pdf_bytes)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            if key in self._disk:
+                return
+            self._disk[key] = len(pdf_bytes)
+            self._disk_bytes += len(pdf_bytes)
+            while self._disk_bytes > self.disk_limit:
+                evicted_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                self.stats['disk_evictions'] += 1
+                try:
+                    os.remove(self._path(evicted_key))
+                except OSError:
+                    pass
+
+    def snapshot(self):
+        """Returns the counters and the current size of both tiers."""
+        with self._lock:
+            return {
+                **{name: self.stats[name] for name in CACHE_COUNTERS},
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'memory_limit': self.memory_limit,
+                'disk_entries': len(self._disk or ()),
+                'disk_bytes': self._disk_bytes,
+                'disk_limit': self.disk_limit,
+            }
+
+CACHE_COUNTERS = ('memory_hits', 'disk_hits', 'misses', 'batch_duplicates', 'memory_evictions', 'disk_evictions')
+
+_pdf_cache = None
+_pdf_cache_lock = threading.Lock()
+
+def get_pdf_cache():
+    """Returns the shared PDF cache, creating it from the app configuration on first use."""
+    global _pdf_cache
+    with _pdf_cache_lock:
+        if _pdf_cache is None:
+            _pdf_cache = PdfCache(app.config['CACHE_MEMORY_BYTES'], app.config['CACHE_DISK_BYTES'],
+                                  app.config['CACHE_FOLDER'])
+        return _pdf_cache
+
+class ConversionBatch:
+    """
+    The conversions of one batch. Each upload is checked by sniff_image, looked
+    up in the cache, and otherwise handed to the process pool as soon as it is
+    submitted; uploads with the same bytes in flight together share one
+    conversion. `convert` is convert_upload for single-page PDFs or
+    convert_upload_page for merged pages.
+    """
+    def __init__(self, options, convert=convert_upload):
+        self.options = options
+        self.convert = convert
+        self.cache = get_pdf_cache()
+        self.executor = get_executor()
+        self.in_flight = {}  # cache key -> task of the first upload with those bytes
+
+    def submit(self, data):
+        """Starts converting `data`. Returns a handle to pass to result()."""
+        count_bytes('upload', len(data))
+        try:
+            sniff_image(data)
+        except ValueError as e:
+            # Rejected before any decode work
+            return None, (None, ConversionError('invalid_image', str(e)), {})
+
+        key = self.cache.key(data, self.options, self.convert.__name__)
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.cache.stats['batch_duplicates'] += 1
+        else:
+            cached = self.cache.get(key)
+            if cached is not None:
+                task = (cached, None, {})
+            else:
+                if self.executor is None:
+                    task = self.convert(data, self.options)
+                else:
+                    task = self.executor.submit(self.convert, data, self.options)
+                self.in_flight[key] = task
+        return key, task
+
+    def result(self, handle):
+        """Waits for a submitted conversion; returns (output_bytes, error)."""
+        key, task = handle
+        output, error, timings = _task_result(self.executor, task)
+        if key is not None and self.in_flight.get(key) is task:
+            del self.in_flight[key]
+            record_stages(timings)
+            if error is None:
+                self.cache.put(key, output)
+        if error is None:
+            count_bytes('pdf', len(output))
+        else:
+            count_failure(error.reason)
+        return output, error
+
+    @staticmethod
+    def cancel(handles):
+        """Cancels conversions whose results are no longer wanted."""
+        for _, task in handles:
+            if not isinstance(task, tuple):
+                task.cancel()
+
+def iter_conversions(sources, options, convert=convert_upload):
+    """
+    Converts (filename, read) sources, where read() returns the image bytes, and
+    yields (filename, output_bytes, error) in input order. `convert` is
+    convert_upload for single-page PDFs or convert_upload_page for merged pages.
+    With more than one worker the images are converted in parallel by the
+    process pool, with at most a few tasks per worker in flight so inputs are
+    only read as workers become free.
+    """
+    batch = ConversionBatch(options, convert)
+    window = 2 * app.config['CONVERT_WORKERS']
+    pending = collections.deque()  # (filename, handle) in input order
+
+    def finish():
+        filename, handle = pending.popleft()
+        output, error = batch.result(handle)
+        return filename, output, error
+
+    try:
+        for filename, read in sources:
+            pending.append((filename, batch.submit(read())))
+            if len(pending) >= window:
+                yield finish()
+        while pending:
+            yield finish()
+    finally:
+        # The client went away before the batch finished
+        batch.cancel(handle for _, handle in pending)
+
+def skip_failed(results):
+    """Yields (filename, output_bytes) from conversion results, reporting and skipping the failures."""
+    for filename, output, error in results:
+        if error is not None:
+            print(f"Failed to process image {filename}: {error}")
+            continue
+        yield filename, output
+
+def iter_converted_files(files, options, convert=convert_upload):
+    """
+    Converts the uploaded files, yielding (filename, output_bytes) in the order
+    given. Files that cannot be converted are reported and skipped.
+
+    The uploads are read here, in the view: the request closes them once the
+    view returns, before a streamed response is sent.
+    """
+    uploads = [(file.filename, file.read()) for file in files]
+    sources = [(filename, lambda data=data: data) for filename, data in uploads]
+    return skip_failed(iter_conversions(sources, options, convert))
+
+def _task_result(executor, task):
+    """
+    Unwraps a conversion task, which is either a finished (output_bytes, error,
+    timings) tuple or a future, turning a crashed worker into a per-file error.
+    """
+    if isinstance(task, tuple):
+        return task
+    try:
+        return task.result()
+    except BrokenProcessPool as e:
+        discard_executor(executor)
+        return None, ConversionError('worker_died', f"worker process died ({e})"), {}
+
+def stream_zip(entries):
+    """Yields a ZIP archive piece by piece, one chunk per (filename, data) entry."""
+    sink = ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for filename, data in entries:
+            with timed_stage('zip_write'):
+                zf.writestr(filename, data)
+            chunk = sink.drain()
+            count_bytes('zip', len(chunk))
+            yield chunk
+    # The central directory is written when the archive is closed
+    yield sink.drain()
+
+def write_merged_pdf(out, pages):
+    """
+    Writes the packed `pages` into `out` as one PDF, a page at a time, so only
+    one page is in memory at once.
+    """
+    writer = PdfWriter(out)
+    for page in pages:
+        writer.add_jpeg_page(*unpack_page(page))
+        yield
+    writer.close()
+    yield
+
+def stream_merged_pdf(pages):
+    """Yields a merged PDF piece by piece, one chunk per page."""
+    sink = ChunkSink()
+    for _ in write_merged_pdf(sink, pages):
+        yield sink.drain()
+
+def conversion_response(converted, output):
+    """
+    Builds the download from (filename, output_bytes) conversions: a merged
+    PDF, or a ZIP of one PDF per image that is streamed or buffered.
+    """
+    if output == 'merged':
+        pages = (page for _, page in converted)
+        first = next(pages, None)
+        if first is None:
+            count_failure('no_valid_images')
+            return render_template_string(HTML_TEMPLATE, message="Error: No valid image files were uploaded.")
+
+        return Response(
+            stream_with_context(stream_merged_pdf(itertools.chain([first], pages))),
+            mimetype='application/pdf',
+            headers={'Content-Disposition': 'attachment; filename=merged.pdf'}
+        )
+
+    converted = ((pdf_filename_for(filename), pdf_bytes) for filename, pdf_bytes in converted)
+
+    if app.config['STREAM_ZIP']:
+        # Convert the first image before committing to a download, so a batch
+        # with no usable images still gets the error page
+        first = next(converted, None)
+        if first is None:
+            count_failure('no_valid_images')
+            return render_template_string(HTML_TEMPLATE, message="Error: No valid image files were uploaded.")
+
+        return Response(
+            stream_with_context(stream_zip(itertools.chain([first], converted))),
+            mimetype='application/zip',
+            headers={'Content-Disposition': 'attachment; filename=converted_images.zip'}
+        )
 
     try:
         memory_zip = io.BytesIO()
+        written = 0
         with zipfile.ZipFile(memory_zip, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for img, filename in images_to_convert:
-                pdf_output = io.BytesIO()
-                
-                # Save each image to a separate PDF in memory
-                img.save(pdf_output, "PDF", resolution=100.0)
-                pdf_output.seek(0)
-                
-                # Create a filename for the PDF
-                base_name = os.path.splitext(secure_filename(filename))[0]
-                pdf_filename = f'{base_name}.pdf'
-                
+            for pdf_filename, pdf_bytes in converted:
                 # Write the PDF to the in-memory zip file
-                zf.writestr(pdf_filename, pdf_output.read())
+                with timed_stage('zip_write'):
+                    zf.writestr(pdf_filename, pdf_bytes)
+                written += 1
 
+        if not written:
+            count_failure('no_valid_images')
+            return render_template_string(HTML_TEMPLATE, message="Error: No valid image files were uploaded.")
+
+        count_bytes('zip', memory_zip.tell())
         memory_zip.seek(0)
 
         # Send the created zip file to the user for download
@@ -123,16 +1293,644 @@ def convert_images_to_pdf():
         )
 
     except Exception as e:
+        count_failure('unexpected')
         return render_template_string(HTML_TEMPLATE, message=f"An unexpected error occurred during PDF creation: {e}")
 
+# Form fields that decide how images are converted. A streamed upload is
+# converted with the values sent before its first image, so later ones may only
+# repeat them.
+STREAMED_OPTION_FIELDS = ('page_size', 'dpi', 'output')
+
+def streamed_conversion(fields):
+    """Returns the (options, convert) that an upload with these form fields is converted with."""
+    convert = convert_upload_page if fields.get('output') == 'merged' else convert_upload
+    return conversion_options(fields), convert
+
+# An uploaded image and either its conversion handle or, while it waits for a
+# free slot in the conversion window, its raw bytes
+StreamedFile = collections.namedtuple('StreamedFile', 'filename data handle')
+
+def iter_multipart(stream, boundary, timings):
+    """
+    Parses a multipart/form-data body as it is read from `stream`, yielding
+    ('field', name, value) and ('file', name, filename, data) as each part
+    completes. Parsing time is added to timings['multipart_parse']. Raises
+    RequestEntityTooLarge past the request's max_form_parts.
+    """
+    decoder = MultipartDecoder(boundary, request.max_form_memory_size, max_parts=request.max_form_parts)
+    part = None
+    chunks = []
+    while True:
+        chunk = stream.read(app.config['STREAM_CHUNK_SIZE'])
+        with timed(timings, 'multipart_parse'):
+            decoder.receive_data(chunk or None)
+            events = []
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                events.append(event)
+                event = decoder.next_event()
+        for part_event in events:
+            if isinstance(part_event, (Field, File)):
+                part = part_event
+                chunks = []
+            elif isinstance(part_event, Data):
+                chunks.append(part_event.data)
+                if not part_event.more_data:
+                    data = b''.join(chunks)
+                    chunks = []
+                    if isinstance(part, File):
+                        yield 'file', part.name, part.filename or '', data
+                    else:
+                        yield 'field', part.name, data.decode('utf-8', 'replace')
+        if not chunk or isinstance(event, Epilogue):
+            return
+
+def convert_streamed_upload():
+    """
+    Handles an upload by parsing the body as it arrives and submitting each
+    image for conversion as soon as its part is complete, so uploading and
+    converting overlap. As in iter_conversions, at most 2 * CONVERT_WORKERS
+    conversions are in flight; later images are kept as uploaded and submitted
+    as results are sent. The response starts once the whole body is read.
+    """
+    boundary = request.mimetype_params['boundary'].encode('latin-1')
+    window = 2 * app.config['CONVERT_WORKERS']
+    timings = {}
+    fields = {}
+    batch = None
+    files = []
+    saw_images_part = saw_filename = False
+    reason = 'invalid_upload'  # A malformed body, unless the options are at fault
+    try:
+        for kind, name, *value in iter_multipart(request.stream, boundary, timings):
+            if kind == 'field':
+                fields[name] = value[0]
+                if batch is not None and name in STREAMED_OPTION_FIELDS:
+                    reason = 'invalid_options'
+                    if streamed_conversion(fields) != (batch.options, batch.convert):
+                        raise ValueError("Form fields must be sent before the images.")
+                    reason = 'invalid_upload'
+                continue
+            if name != 'images':
+                continue
+            saw_images_part = True
+            filename, data = value
+            saw_filename = saw_filename or filename != ''
+            if not filename.lower().endswith(ALLOWED_EXTENSIONS):
+                continue
+            if batch is None:
+                reason = 'invalid_options'
+                batch = ConversionBatch(*streamed_conversion(fields))
+                reason = 'invalid_upload'
+            if len(files) < window:
+                files.append(StreamedFile(filename, None, batch.submit(data)))
+            else:
+                files.append(StreamedFile(filename, data, None))
+    except ValueError as e:
+        if batch is not None:
+            batch.cancel(file.handle for file in files if file.handle is not None)
+        count_failure(reason)
+        return render_template_string(HTML_TEMPLATE, message=f"Error: {e}")
+    except RequestEntityTooLarge:
+        if batch is not None:
+            batch.cancel(file.handle for file in files if file.handle is not None)
+        count_failure('too_large')
+        raise
+    finally:
+        record_stages(timings)
+
+    if not saw_images_part:
+        return render_template_string(HTML_TEMPLATE, message="Error: No image files part in the request.")
+    if not saw_filename:
+        return render_template_string(HTML_TEMPLATE, message="Error: No selected files.")
+    if batch is None:
+        count_failure('no_valid_images')
+        return render_template_string(HTML_TEMPLATE, message="Error: No valid image files were uploaded.")
+
+    files = order_files(files, fields.get('page_order', 'upload'))
+
+    def results():
+        in_flight = {i: file.handle for i, file in enumerate(files) if file.handle is not None}
+        waiting = collections.deque(i for i, file in enumerate(files) if file.handle is None)
+        finished = {}  # index -> (output_bytes, error) collected early to free a slot
+
+        def submit(i):
+            in_flight[i] = batch.submit(files[i].data)
+            files[i] = files[i]._replace(data=None)
+
+        try:
+            for i, file in enumerate(files):
+                if file.data is not None:
+                    # page_order put a waiting file ahead of submitted ones
+                    if len(in_flight) >= window:
+                        j = min(in_flight)
+                        finished[j] = batch.result(in_flight.pop(j))
+                    submit(i)
+                while waiting and len(in_flight) < window:
+                    j = waiting.popleft()
+                    if files[j].data is not None:
+                        submit(j)
+                output, error = finished.pop(i) if i in finished else batch.result(in_flight.pop(i))
+                yield file.filename, output, error
+        finally:
+            batch.cancel(in_flight.values())
+
+    return conversion_response(skip_failed(results()), fields.get('output'))
+
+@app.route('/convert_images', methods=['POST'])
+def convert_images_to_pdf():
+    """Handles the image file uploads and conversion process."""
+    if (app.config['STREAM_UPLOADS'] and request.mimetype == 'multipart/form-data'
+            and 'boundary' in request.mimetype_params):
+        return convert_streamed_upload()
+
+    with timed_stage('multipart_parse'):
+        # The multipart body is parsed on first access
+        request.files
+
+    if 'images' not in request.files:
+        return render_template_string(HTML_TEMPLATE, message="Error: No image files part in the request.")
+
+    files = request.files.getlist('images')
+    if not files or all(file.filename == '' for file in files):
+        return render_template_string(HTML_TEMPLATE, message="Error: No selected files.")
+
+    files = [file for file in files if file and file.filename.lower().endswith(ALLOWED_EXTENSIONS)]
+    files = order_files(files, request.form.get('page_order', 'upload'))
+    try:
+        options = conversion_options(request.form)
+    except ValueError as e:
+        count_failure('invalid_options')
+        return render_template_string(HTML_TEMPLATE, message=f"Error: {e}")
+
+    output = request.form.get('output')
+    convert = convert_upload_page if output == 'merged' else convert_upload
+    return conversion_response(iter_converted_files(files, options, convert), output)
+
+# --- Background conversion jobs ---
+# Each job lives in its own directory under UPLOAD_FOLDER holding the uploaded
+# images, a job.json progress file and, once finished, the result archive.
+JOB_STATE_FILE = 'job.json'
+# Result file name and type for each output mode
+JOB_RESULTS = {
+    'zip': ('converted_images.zip', 'application/zip'),
+    'merged': ('merged.pdf', 'application/pdf'),
+}
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+JOB_SWEEP_INTERVAL = 60  # Seconds between scans for expired jobs
+
+jobs = {}  # Jobs started by this process, by id
+jobs_lock = threading.Lock()
+job_queue = None
+_job_threads = []
+_last_job_sweep = 0.0
+
+class Job:
+    """Progress of one background conversion batch."""
+    def __init__(self, job_id, filenames, sizes, output, options):
+        self.id = job_id
+        self.status = 'queued'
+        self.output = output
+        self.options = options
+        self.filenames = filenames
+        self.total = len(filenames)
+        self.done = 0
+        self.failed = 0
+        self.bytes_total = sum(sizes)
+        self.bytes_done = 0
+        self.bytes_out = 0
+        self.errors = []
+        self.created = time.time()
+        self.finished = None
+        self.pid = os.getpid()  # The process whose job queue holds the job
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'output': self.output,
+            'files_total': self.total,
+            'files_done': self.done,
+            'files_failed': self.failed,
+            'bytes_total': self.bytes_total,
+            'bytes_done': self.bytes_done,
+            'bytes_out': self.bytes_out,
+            'errors': list(self.errors),
+            'created': self.created,
+            'finished': self.finished,
+            'pid': self.pid,
+        }
+
+def job_dir(job_id):
+    """Returns the directory holding the files of a job."""
+    return os.path.join(app.config['UPLOAD_FOLDER'], job_id)
+
+def job_input_path(job_id, index):
+    """Returns where the index-th uploaded image of a job is spooled."""
+    return os.path.join(job_dir(job_id), f'input-{index:05d}')
+
+def save_job_state(job_id, state):
+    """
+    Writes a snapshot of the job progress to disk so it can be read back after
+    the job object is gone. Take the snapshot under jobs_lock and write it
+    after releasing the lock, so status requests never wait on the disk.
+    """
+    path = os.path.join(job_dir(job_id), JOB_STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+def load_job_state(job_id):
+    """Returns the progress of a job as a dict, or None if the job does not exist."""
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+    try:
+        with open(os.path.join(job_dir(job_id), JOB_STATE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def run_job(job):
+    """Converts the images of a job into the result archive in its directory."""
+    with jobs_lock:
+        job.status = 'running'
+        state = job.to_dict()
+    save_job_state(job.id, state)
+
+    sources = [(filename, lambda i=i: read_file(job_input_path(job.id, i)))
+               for i, filename in enumerate(job.filenames)]
+    result_path = os.path.join(job_dir(job.id), JOB_RESULTS[job.output][0])
+
+    def record(i, filename, output, error):
+        """Updates the progress once an image has been converted."""
+        input_path = job_input_path(job.id, i)
+        size = os.path.getsize(input_path)
+        os.remove(input_path)
+
+        with jobs_lock:
+            job.done += 1
+            job.bytes_done += size
+            if error is None:
+                job.bytes_out += len(output)
+            else:
+                job.failed += 1
+                job.errors.append({'file': filename, 'error': str(error)})
+            state = job.to_dict()
+        save_job_state(job.id, state)
+
+    try:
+        with open(result_path + '.part', 'wb') as out:
+            if job.output == 'merged':
+                def pages():
+                    for i, (filename, page, error) in enumerate(
+                            iter_conversions(sources, job.options, convert_upload_page)):
+                        record(i, filename, page, error)
+                        if error is None:
+                            yield page
+                for _ in write_merged_pdf(out, pages()):
+                    pass
+            else:
+                with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as zf:
+                    for i, (filename, pdf_bytes, error) in enumerate(iter_conversions(sources, job.options)):
+                        if error is None:
+                            with timed_stage('zip_write'):
+                                zf.writestr(pdf_filename_for(filename), pdf_bytes)
+                        record(i, filename, pdf_bytes, error)
+
+        if job.failed == job.total:
+            os.remove(result_path + '.part')
+            status = 'failed'
+        else:
+            os.replace(result_path + '.part', result_path)
+            status = 'done'
+    except Exception as e:
+        status = 'failed'
+        if os.path.exists(result_path + '.part'):
+            os.remove(result_path + '.part')
+        with jobs_lock:
+            job.errors.append({'file': None, 'error': f"An unexpected error occurred during PDF creation: {e}"})
+
+    with jobs_lock:
+        job.status = status
+        job.finished = time.time()
+        state = job.to_dict()
+    save_job_state(job.id, state)
+
+def job_worker():
+    """Runs queued jobs one after another."""
+    while True:
+        job = job_queue.get()
+        try:
+            run_job(job)
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+        finally:
+            job_queue.task_done()
+
+def start_job_workers():
+    """Creates the job queue and its worker threads on first use."""
+    global job_queue
+    with jobs_lock:
+        if job_queue is None:
+            job_queue = queue.Queue(maxsize=app.config['JOB_QUEUE_SIZE'])
+        while len(_job_threads) < app.config['JOB_WORKERS']:
+            thread = threading.Thread(target=job_worker, daemon=True)
+            thread.start()
+            _job_threads.append(thread)
+
+def process_alive(pid):
+    """True if a process with this id is running."""
+    if os.name == 'nt':
+        # os.kill would terminate it; abandoned jobs are caught by JOB_MAX_AGE instead
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def job_abandoned(state, now):
+    """
+    True if an unfinished job that is not in this process's jobs will never
+    finish: the process that queued it is gone, or it is older than JOB_MAX_AGE.
+    """
+    if now - state['created'] > app.config['JOB_MAX_AGE']:
+        return True
+    pid = state.get('pid')
+    if pid is None or pid == os.getpid():
+        # Queued by an earlier process that had the same id, such as before a restart
+        return True
+    return not process_alive(pid)
+
+def fail_abandoned_job(job_id, state, now):
+    """Marks an abandoned job as failed and frees its spooled images."""
+    state.update(status='failed', finished=now,
+                 errors=state['errors'] + [{'file': None, 'error': "The job was interrupted before it finished."}])
+    save_job_state(job_id, state)
+    for name in os.listdir(job_dir(job_id)):
+        if name.startswith('input-') or name.endswith('.part'):
+            try:
+                os.remove(os.path.join(job_dir(job_id), name))
+            except OSError:
+                pass
+
+def expire_jobs():
+    """
+    Deletes finished jobs, and their archives, once they are older than JOB_TTL.
+    Abandoned jobs are failed first, so they expire the same way.
+    """
+    global _last_job_sweep
+    now = time.time()
+    if now - _last_job_sweep < JOB_SWEEP_INTERVAL:
+        return
+    _last_job_sweep = now
+
+    try:
+        entries = os.listdir(app.config['UPLOAD_FOLDER'])
+    except OSError:
+        return
+    for job_id in entries:
+        if not JOB_ID_PATTERN.fullmatch(job_id):
+            continue
+        state = load_job_state(job_id)
+        if state is None:
+            # Left behind by a submission that never completed
+            expired = now - os.path.getmtime(job_dir(job_id)) > app.config['JOB_TTL']
+        else:
+            if state['finished'] is None:
+                with jobs_lock:
+                    owned = job_id in jobs
+                if not owned and job_abandoned(state, now):
+                    fail_abandoned_job(job_id, state, now)
+            expired = state['finished'] is not None and now - state['finished'] > app.config['JOB_TTL']
+        if expired:
+            with jobs_lock:
+                jobs.pop(job_id, None)
+            shutil.rmtree(job_dir(job_id), ignore_errors=True)
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Reports the hit, miss and eviction counters of the PDF cache."""
+    return jsonify(get_pdf_cache().snapshot())
+
+def job_urls(job_id):
+    """Returns the polling and download URLs of a job."""
+    return {'status_url': f'/jobs/{job_id}', 'result_url': f'/jobs/{job_id}/result'}
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    """Answers the job API in its JSON error shape; the form keeps Werkzeug's page."""
+    if request.endpoint != 'submit_job':
+        return e
+    count_failure('too_large')
+    return jsonify(error=e.description), 413
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queues the uploaded images for background conversion and returns the job id."""
+    expire_jobs()
+    start_job_workers()
+    if job_queue.full():
+        # Refuse before the upload is parsed and spooled
+        count_failure('queue_full')
+        return jsonify(error="Too many conversion jobs are queued. Try again later."), 429
+
+    with timed_stage('multipart_parse'):
+        files = [file for file in request.files.getlist('images')
+                 if file and file.filename.lower().endswith(ALLOWED_EXTENSIONS)]
+    if not files:
+        count_failure('no_valid_images')
+        return jsonify(error="No valid image files were uploaded."), 400
+    output = request.form.get('output', 'zip')
+    if output not in JOB_RESULTS:
+        return jsonify(error=f"Unknown output mode '{output}'."), 400
+    try:
+        options = conversion_options(request.form)
+    except ValueError as e:
+        count_failure('invalid_options')
+        return jsonify(error=str(e)), 400
+    files = order_files(files, request.form.get('page_order', 'upload'))
+
+    job_id = uuid.uuid4().hex
+    os.makedirs(job_dir(job_id))
+    sizes = []
+    for i, file in enumerate(files):
+        path = job_input_path(job_id, i)
+        file.save(path)
+        sizes.append(os.path.getsize(path))
+
+    job = Job(job_id, [file.filename for file in files], sizes, output, options)
+    with jobs_lock:
+        jobs[job_id] = job
+        state = job.to_dict()
+    save_job_state(job_id, state)
+    try:
+        job_queue.put_nowait(job)
+    except queue.Full:
+        with jobs_lock:
+            jobs.pop(job_id, None)
+        shutil.rmtree(job_dir(job_id), ignore_errors=True)
+        count_failure('queue_full')
+        return jsonify(error="Too many conversion jobs are queued. Try again later."), 429
+
+    response = jsonify(id=job_id, status=job.status, **job_urls(job_id))
+    response.status_code = 202
+    response.headers['Location'] = f'/jobs/{job_id}'
+    return response
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Reports the progress of a background job."""
+    expire_jobs()
+    state = load_job_state(job_id) if JOB_ID_PATTERN.fullmatch(job_id) else None
+    if state is None:
+        return jsonify(error="Unknown or expired job."), 404
+    return jsonify(**state, **job_urls(job_id))
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """Downloads the archive or merged PDF of a finished job."""
+    state = load_job_state(job_id) if JOB_ID_PATTERN.fullmatch(job_id) else None
+    if state is None:
+        return jsonify(error="Unknown or expired job."), 404
+    if state['status'] != 'done':
+        return jsonify(error=f"Job is {state['status']}.", status=state['status']), 409
+    result_name, mimetype = JOB_RESULTS[state.get('output', 'zip')]
+    return send_file(
+        os.path.abspath(os.path.join(job_dir(job_id), result_name)),
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=result_name
+    )
+
+# --- Production serving ---
+# serve() pre-forks worker processes that accept connections from one shared
+# listening socket. Each worker is a single-threaded Werkzeug server, so
+# throughput comes from the number of workers. /metrics adds up all workers;
+# the memory cache and the job queue belong to the worker that served the request.
+
+def preload():
+    """
+    Loads what every worker needs before forking, so the workers share those
+    memory pages instead of each importing them again.
+    """
+    # Imports every Pillow codec plugin, which Image.open otherwise does on first use
+    Image.init()
+    # Keep the garbage collector from touching, and so copying, the preloaded objects
+    gc.freeze()
+
+def serve_worker(listener, max_requests):
+    """Serves requests on the shared socket until max_requests have been handled (0 for no limit)."""
+    server = make_server(*listener.getsockname()[:2], app, fd=listener.fileno())
+    publish_worker_metrics()
+    threading.Thread(target=publish_worker_metrics_loop, daemon=True).start()
+    if max_requests:
+        # Spread out the restarts so the workers are not all replaced at once
+        max_requests += random.randrange(max_requests // 10 + 1)
+    handled = 0
+    while not max_requests or handled < max_requests:
+        server.handle_request()
+        handled += 1
+        publish_worker_metrics()
+    # Jobs accepted by this worker run in its threads, so let them finish
+    if job_queue is not None:
+        job_queue.join()
+    publish_worker_metrics()
+
+def serve(host, port, workers, max_requests):
+    """
+    Runs the app on `workers` pre-forked processes, replacing each one after it
+    has served about max_requests requests to return the memory large images
+    leave fragmented.
+    """
+    if not hasattr(os, 'fork'):
+        print("Pre-forked workers need os.fork; using the development server instead.")
+        app.run(host=host, port=port, debug=False)
+        return
+
+    # The workers are the parallelism; a conversion pool in each would oversubscribe the cores
+    app.config['CONVERT_WORKERS'] = 1
+    app.config['METRICS_FOLDER'] = tempfile.mkdtemp(prefix='bulkjpgtopdf-metrics-')
+    listener = socket.create_server((host, port), backlog=128)
+    preload()
+    children = set()
+
+    def spawn():
+        pid = os.fork()
+        if pid:
+            children.add(pid)
+            return
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        # Ctrl+C reaches the whole process group; the parent stops the workers
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        code = 0
+        try:
+            serve_worker(listener, max_requests)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    for _ in range(workers):
+        spawn()
+    print(f"Serving on http://{host}:{port}/ with {workers} worker processes")
+    try:
+        while True:
+            pid, status = os.wait()
+            if pid not in children:
+                continue
+            children.discard(pid)
+            retire_worker_metrics(pid)
+            if status:
+                # Don't spin if workers keep crashing
+                time.sleep(1)
+            spawn()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        listener.close()
+        shutil.rmtree(app.config['METRICS_FOLDER'], ignore_errors=True)
+
 def open_browser():
     """This function opens the default web browser to the app's URL."""
+    import webbrowser
     webbrowser.open_new_tab('http://127.0.0.1:5000/')
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Image to PDF converter web app.")
+    parser.add_argument('--workers', type=int, nargs='?', const=os.cpu_count() or 1, default=0,
+                        help="serve with this many pre-forked worker processes (default: one per core) "
+                             "instead of the development server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--max-requests', type=int, default=app.config['SERVER_MAX_REQUESTS'],
+                        help="requests a worker serves before it is replaced; 0 never replaces it")
+    args = parser.parse_args()
+
     # Create the uploads folder if it doesn't exist
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    # Start a timer to open the browser after a 1-second delay
-    Timer(1, open_browser).start()
-    # Run the Flask application
-    app.run(debug=False)
+    if args.workers:
+        serve(args.host, args.port, args.workers, args.max_requests)
+    else:
+        # Start a timer to open the browser after a 1-second delay
+        Timer(1, open_browser).start()
+        # Run the Flask application
+        app.run(host=args.host, port=args.port, debug=False)
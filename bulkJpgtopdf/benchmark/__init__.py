@@ -0,0 +1,10 @@
+"""
+Benchmark and load generator for the /convert_images endpoint.
+
+Run it from the bulkJpgtopdf directory:
+
+    python -m benchmark --transport client socket --concurrency 1 4 --out results.json
+    python -m benchmark --compare baseline.json results.json
+
+See `python -m benchmark --help` for the corpus and load options.
+"""
@@ -0,0 +1,129 @@
+"""Command line entry point: python -m benchmark"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import itertools
+
+import app as converter
+from benchmark.corpus import FORMATS, build_batch
+from benchmark.runner import TRANSPORTS, run_scenario
+
+def parse_size(text):
+    """Parses WIDTHxHEIGHT."""
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+def run(args):
+    """Runs every combination of the load options and writes the results as JSON."""
+    converter.app.config['CONVERT_WORKERS'] = args.workers
+    if not args.cache:
+        # Repeated requests would otherwise only measure the cache
+        converter.app.config['CACHE_MEMORY_BYTES'] = 0
+        converter.app.config['CACHE_DISK_BYTES'] = 0
+    converter.app.config['MAX_CONTENT_LENGTH'] = None
+
+    fields = {'output': args.output}
+    if args.dpi:
+        fields['dpi'] = args.dpi
+    if args.page_size:
+        fields['page_size'] = args.page_size
+
+    scenarios = []
+    for batch_size, transport, concurrency in itertools.product(args.batch_sizes, args.transport, args.concurrency):
+        batch = build_batch(args.formats, args.sizes, batch_size, seed=args.seed)
+        name = f'{transport}-batch{batch_size}-c{concurrency}'
+        print(f'Running {name} ...', file=sys.stderr)
+        results = run_scenario(batch, transport, concurrency, args.requests, fields, warmup=args.warmup)
+        scenarios.append({
+            'name': name,
+            'params': {
+                'transport': transport,
+                'concurrency': concurrency,
+                'batch_size': batch_size,
+                'formats': args.formats,
+                'sizes': [f'{w}x{h}' for w, h in args.sizes],
+                'input_bytes': sum(len(data) for _, data in batch),
+                **fields,
+            },
+            'results': results,
+        })
+        print(f"  {results['images_per_second']:.1f} images/s, {results['mb_per_second']:.2f} MB/s, "
+              f"p95 {results['latency']['p95'] * 1000:.0f} ms", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'workers': args.workers,
+            'cache': args.cache,
+            'seed': args.seed,
+        },
+        'scenarios': scenarios,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+def compare(args):
+    """
+    Compares two result files scenario by scenario. Exits with status 1 if
+    throughput fell, or p95 latency rose, by more than the threshold.
+    """
+    with open(args.compare[0]) as f:
+        baseline = {s['name']: s['results'] for s in json.load(f)['scenarios']}
+    with open(args.compare[1]) as f:
+        current = {s['name']: s['results'] for s in json.load(f)['scenarios']}
+
+    regressions = 0
+    for name in sorted(baseline.keys() & current.keys()):
+        old, new = baseline[name], current[name]
+        throughput = new['images_per_second'] / old['images_per_second'] - 1
+        p95 = new['latency']['p95'] / old['latency']['p95'] - 1
+        regressed = throughput < -args.threshold or p95 > args.threshold
+        regressions += regressed
+        print(f"{'REGRESSION' if regressed else 'ok':10} {name}: throughput {throughput:+.1%}, p95 latency {p95:+.1%}")
+
+    missing = baseline.keys() - current.keys()
+    for name in sorted(missing):
+        print(f'{"missing":10} {name}')
+    sys.exit(1 if regressions or missing else 0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the /convert_images endpoint.")
+    parser.add_argument('--formats', nargs='+', choices=sorted(FORMATS), default=['jpeg', 'png', 'gif', 'bmp'])
+    parser.add_argument('--sizes', nargs='+', type=parse_size, default=[(1280, 960), (3000, 2000)],
+                        help="image sizes as WIDTHxHEIGHT")
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 10])
+    parser.add_argument('--transport', nargs='+', choices=sorted(TRANSPORTS), default=['client'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1])
+    parser.add_argument('--requests', type=int, default=5, help="requests per scenario")
+    parser.add_argument('--warmup', type=int, default=1, help="unmeasured requests before each scenario")
+    parser.add_argument('--workers', type=int, default=converter.app.config['CONVERT_WORKERS'],
+                        help="conversion worker processes")
+    parser.add_argument('--output', choices=['zip', 'merged'], default='zip')
+    parser.add_argument('--dpi')
+    parser.add_argument('--page-size')
+    parser.add_argument('--cache', action='store_true', help="leave the PDF cache on")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help="write the JSON results here instead of stdout")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help="compare two result files instead of running")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="relative change counted as a regression (default 0.10)")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args)
+    else:
+        run(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Synthetic image corpora for the benchmark."""
+import io
+import zlib
+import random
+
+from PIL import Image, ImageDraw
+
+# Pillow format name and file extension for each corpus format
+FORMATS = {
+    'jpeg': ('JPEG', '.jpg'),
+    'png': ('PNG', '.png'),
+    'gif': ('GIF', '.gif'),
+    'bmp': ('BMP', '.bmp'),
+}
+
+def make_image(width, height, seed):
+    """
+    Draws a reproducible test image: a colour gradient with noise and a few
+    shapes, so it compresses roughly like a photo or a scanned page.
+    """
+    rng = random.Random(seed)
+    red = Image.linear_gradient('L').resize((width, height))
+    green = Image.linear_gradient('L').rotate(90).resize((width, height))
+    blue = Image.effect_noise((width, height), 48).point(lambda v: (v + rng.randrange(64)) % 256)
+    img = Image.merge('RGB', (red, green, blue))
+
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randrange(width // 4 + 1), y0 + rng.randrange(height // 4 + 1)
+        colour = tuple(rng.randrange(256) for _ in range(3))
+        draw.rectangle((x0, y0, x1, y1), outline=colour, width=3)
+    return img
+
+def encode(img, fmt):
+    """Returns the bytes of `img` saved in corpus format `fmt`."""
+    pillow_format, _ = FORMATS[fmt]
+    if fmt == 'gif':
+        img = img.convert('P', palette=Image.ADAPTIVE)
+    output = io.BytesIO()
+    img.save(output, pillow_format, **({'quality': 90} if fmt == 'jpeg' else {}))
+    return output.getvalue()
+
+def build_batch(formats, sizes, batch_size, seed=0):
+    """
+    Returns a batch of `batch_size` (filename, bytes) uploads cycling through the
+    given formats and (width, height) sizes. The same arguments always give the
+    same bytes.
+    """
+    batch = []
+    rendered = {}
+    for i in range(batch_size):
+        fmt = formats[i % len(formats)]
+        width, height = sizes[(i // len(formats)) % len(sizes)]
+        key = (fmt, width, height)
+        if key not in rendered:
+            rendered[key] = encode(make_image(width, height, seed=zlib.crc32(repr(key).encode()) ^ seed), fmt)
+        # Trailing bytes keep the uploads of a batch distinct, so duplicate
+        # detection does not hide the conversion cost; every decoder ignores them
+        data = rendered[key] + i.to_bytes(4, 'big')
+        batch.append((f'image_{i:04d}_{width}x{height}{FORMATS[fmt][1]}', data))
+    return batch
@@ -0,0 +1,222 @@
+"""Drives the converter with a batch of uploads and measures what happens."""
+import os
+import math
+import time
+import uuid
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import make_server
+
+import app as converter
+
+def percentile(values, fraction):
+    """Returns the value below which `fraction` of `values` fall (nearest rank)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+def current_rss():
+    """
+    Returns the resident memory in bytes of this process plus the conversion
+    worker processes, or None if it cannot be read on this platform.
+    """
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+
+    if psutil is not None:
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    # Linux without psutil: this process only
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+class RssSampler:
+    """Samples the resident memory in the background so each request can report its peak."""
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.latest = current_rss()
+        self._watchers = {}  # request id -> highest sample seen since it started
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss()
+            if rss is None:
+                return
+            with self._lock:
+                self.latest = rss
+                for key, peak in self._watchers.items():
+                    if rss > peak:
+                        self._watchers[key] = rss
+
+    def start(self):
+        """Starts watching for one request; returns (token, baseline RSS)."""
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._watchers[token] = self.latest or 0
+            return token, self.latest
+
+    def stop(self, token):
+        """Returns the highest RSS seen since start(token)."""
+        with self._lock:
+            return self._watchers.pop(token)
+
+def multipart_body(batch, fields):
+    """Encodes the uploads and form fields as multipart/form-data; returns (content type, body)."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for filename, data in batch:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="images"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return f'multipart/form-data; boundary={boundary}', b''.join(parts)
+
+class ClientTransport:
+    """Sends requests through Flask's test client, in this process."""
+    name = 'client'
+
+    def __init__(self):
+        self.client = converter.app.test_client()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def send(self, content_type, body):
+        """Posts a batch; returns (status, response bytes, seconds to first byte)."""
+        start = time.perf_counter()
+        response = self.client.post('/convert_images', data=body, content_type=content_type, buffered=False)
+        ttfb = None
+        received = 0
+        for chunk in response.response:
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            received += len(chunk)
+        response.close()
+        return response.status_code, received, ttfb
+
+class SocketTransport:
+    """Sends requests over HTTP to the app served on a local socket by a threaded Werkzeug server."""
+    name = 'socket'
+
+    def __enter__(self):
+        self.server = make_server('127.0.0.1', 0, converter.app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.thread.join()
+
+    def send(self, content_type, body):
+        start = time.perf_counter()
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.server_port, timeout=600)
+        try:
+            connection.request('POST', '/convert_images', body=body, headers={'Content-Type': content_type})
+            response = connection.getresponse()
+            ttfb = None
+            received = 0
+            while True:
+                chunk = response.read1(64 * 1024)
+                if not chunk:
+                    break
+                if ttfb is None:
+                    ttfb = time.perf_counter() - start
+                received += len(chunk)
+            return response.status, received, ttfb
+        finally:
+            connection.close()
+
+TRANSPORTS = {
+    'client': ClientTransport,
+    'socket': SocketTransport,
+}
+
+def run_scenario(batch, transport_name, concurrency, requests, fields, warmup=1):
+    """
+    Sends `requests` copies of `batch` through the transport, `concurrency` at a
+    time, and returns the throughput, latency, memory and stage measurements.
+    """
+    content_type, body = multipart_body(batch, fields)
+    input_bytes = sum(len(data) for _, data in batch)
+
+    with TRANSPORTS[transport_name]() as transport, RssSampler() as sampler:
+        for _ in range(warmup):
+            transport.send(content_type, body)
+        converter.stage_stats_snapshot(reset=True)
+
+        def one_request(_):
+            token, baseline = sampler.start()
+            start = time.perf_counter()
+            status, received, ttfb = transport.send(content_type, body)
+            latency = time.perf_counter() - start
+            peak = sampler.stop(token)
+            return {
+                'status': status,
+                'latency': latency,
+                'ttfb': ttfb,
+                'bytes_out': received,
+                'peak_rss_delta': None if baseline is None else max(0, peak - baseline),
+            }
+
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one_request, range(requests)))
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        stages = converter.stage_stats_snapshot(reset=True)
+
+    latencies = [r['latency'] for r in results]
+    ttfbs = [r['ttfb'] for r in results if r['ttfb'] is not None]
+    rss = [r['peak_rss_delta'] for r in results if r['peak_rss_delta'] is not None]
+    stage_total = sum(stats['seconds'] for stats in stages.values()) or 1.0
+
+    return {
+        'requests': requests,
+        'errors': sum(1 for r in results if r['status'] != 200),
+        'wall_seconds': wall,
+        'cpu_seconds': cpu,
+        'images_per_second': len(batch) * requests / wall,
+        'mb_per_second': input_bytes * requests / wall / 1e6,
+        'latency': {name: percentile(latencies, q) for name, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))},
+        'ttfb': {name: percentile(ttfbs, q) for name, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))},
+        'peak_rss_delta_bytes': {'p50': percentile(rss, 0.5), 'max': max(rss) if rss else None},
+        'bytes_out_per_request': results[0]['bytes_out'] if results else 0,
+        'stages': {
+            stage: {**stats, 'share': stats['seconds'] / stage_total}
+            for stage, stats in stages.items()
+        },
+    }
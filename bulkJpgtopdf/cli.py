@@ -0,0 +1,153 @@
+"""
+Converts every image under a directory tree to PDF without going through the
+web interface. Uses the same conversion code as the /convert_images endpoint.
+
+    python cli.py scans/                     # PDFs next to the images
+    python cli.py scans/ --output pdfs/      # PDFs in a mirrored tree under pdfs/
+    python cli.py scans/ --workers 8 --dpi 150 --page-size a4
+
+Images whose PDF is newer than the image are skipped, so reruns only convert
+what changed. Images that would share a PDF, such as scan.jpg and scan.png,
+are not converted after the first; they are reported as failed.
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import app as converter
+
+def iter_images(root, skip_dir=None):
+    """Yields the paths of the images under `root`, walking the tree lazily."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"Cannot read directory {directory}: {e}", file=sys.stderr)
+            continue
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if skip_dir is None or os.path.abspath(entry.path) != skip_dir:
+                    subdirectories.append(entry.path)
+            elif entry.name.lower().endswith(converter.ALLOWED_EXTENSIONS):
+                yield entry.path
+        # Visit subdirectories in name order
+        stack.extend(reversed(subdirectories))
+
+def target_path(source, root, output):
+    """Returns where the PDF for `source` goes: next to it, or mirrored under `output`."""
+    base_name = os.path.splitext(os.path.basename(source))[0] + '.pdf'
+    if output is None:
+        return os.path.join(os.path.dirname(source), base_name)
+    relative_dir = os.path.relpath(os.path.dirname(source), root)
+    return os.path.normpath(os.path.join(output, relative_dir, base_name))
+
+def is_up_to_date(source, target):
+    """True if `target` exists and is at least as new as `source`."""
+    try:
+        return os.path.getmtime(target) >= os.path.getmtime(source)
+    except OSError:
+        return False
+
+def convert_path(source, target, options):
+    """
+    Converts one image file and writes its PDF. Runs in a worker process and
+    returns (bytes read, bytes written, error, stage timings).
+    """
+    timings = {}
+    data = b''
+    try:
+        data = converter.read_file(source)
+        converter.sniff_image(data)
+        pdf_bytes = converter.convert_image_to_pdf(data, options, timings)
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        # Write to a temporary file first so an interrupted run never leaves a
+        # truncated PDF that looks up to date
+        temp_path = f'{target}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(pdf_bytes)
+        os.replace(temp_path, target)
+        return len(data), len(pdf_bytes), None, timings
+    except Exception as e:
+        return len(data), 0, converter.ConversionError(type(e).__name__, str(e)), timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert every image under a directory to PDF.")
+    parser.add_argument('source', help="directory to convert")
+    parser.add_argument('--output', help="write the PDFs into a mirrored tree here instead of next to the images")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--force', action='store_true', help="convert images even if their PDF is up to date")
+    parser.add_argument('--dpi', help="maximum pixels per inch of the output")
+    parser.add_argument('--page-size', help=f"fit images on a page: {', '.join(converter.PAGE_SIZES)}")
+    parser.add_argument('--no-passthrough', action='store_true', help="re-encode JPEGs instead of embedding them")
+    args = parser.parse_args()
+
+    root = os.path.abspath(args.source)
+    output = os.path.abspath(args.output) if args.output else None
+    if not os.path.isdir(root):
+        parser.error(f"{args.source} is not a directory")
+
+    converter.app.config['JPEG_PASSTHROUGH'] = not args.no_passthrough
+    try:
+        options = converter.conversion_options({'dpi': args.dpi, 'page_size': args.page_size})
+    except ValueError as e:
+        parser.error(str(e))
+
+    converted = skipped = failed = 0
+    bytes_in = bytes_out = 0
+    start = time.perf_counter()
+
+    def collect(future, source):
+        nonlocal converted, failed, bytes_in, bytes_out
+        read, written, error, timings = future.result()
+        converter.record_stages(timings)
+        bytes_in += read
+        if error is None:
+            converted += 1
+            bytes_out += written
+        else:
+            failed += 1
+            print(f"Failed to process image {source}: {error}", file=sys.stderr)
+
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        pending = {}  # future -> source path
+        claimed = {}  # target path -> the source whose PDF it is
+        # Keep a few tasks per worker queued so workers never wait for the directory walk
+        window = 4 * max(1, args.workers)
+        for source in iter_images(root, skip_dir=output):
+            target = target_path(source, root, output)
+            owner = claimed.setdefault(os.path.normcase(target), source)
+            if owner != source:
+                failed += 1
+                print(f"Failed to process image {source}: {os.path.basename(owner)} "
+                      f"already converts to {target}", file=sys.stderr)
+                continue
+            if not args.force and is_up_to_date(source, target):
+                skipped += 1
+                continue
+            pending[executor.submit(convert_path, source, target, options)] = source
+            if len(pending) >= window:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future, pending.pop(future))
+        for future in list(pending):
+            collect(future, pending.pop(future))
+
+    elapsed = time.perf_counter() - start
+    print(f"Converted {converted} images, skipped {skipped} up to date, {failed} failed "
+          f"in {elapsed:.1f}s")
+    if converted:
+        print(f"Throughput: {converted / elapsed:.1f} images/s, {bytes_in / elapsed / 1e6:.2f} MB/s in, "
+              f"{bytes_out / 1e6:.1f} MB of PDFs written")
+        stages = converter.stage_stats_snapshot()
+        total = sum(stats['seconds'] for stats in stages.values()) or 1.0
+        print("Worker time by stage: " + ', '.join(
+            f"{stage} {stats['seconds'] / total:.0%}" for stage, stats in stages.items() if stats['count']))
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
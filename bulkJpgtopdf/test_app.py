@@ -0,0 +1,272 @@
+import io
+import os
+import re
+import sys
+import time
+import zipfile
+import subprocess
+
+import pytest
+from PIL import Image
+
+import app as converter
+
+def png_bytes(index):
+    """Returns a small PNG that differs from the other indexes, so the cache cannot merge them."""
+    out = io.BytesIO()
+    Image.new('RGB', (8 + index, 8), (index * 20, 0, 0)).save(out, 'PNG')
+    return out.getvalue()
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # One worker converts inline with a window of two, so five files outlast it
+    monkeypatch.setitem(converter.app.config, 'CONVERT_WORKERS', 1)
+    monkeypatch.setitem(converter.app.config, 'CACHE_FOLDER', str(tmp_path / 'cache'))
+    monkeypatch.setattr(converter, '_pdf_cache', None)
+    return converter.app.test_client()
+
+@pytest.mark.parametrize('stream_uploads', [False, True])
+def test_zip_contains_every_upload(client, monkeypatch, stream_uploads):
+    monkeypatch.setitem(converter.app.config, 'STREAM_UPLOADS', stream_uploads)
+    names = [f'page{i}.png' for i in range(5)]
+    data = {'images': [(io.BytesIO(png_bytes(i)), name) for i, name in enumerate(names)]}
+
+    response = client.post('/convert_images', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        assert zf.namelist() == [f'page{i}.pdf' for i in range(5)]
+        for name in zf.namelist():
+            assert zf.read(name).startswith(b'%PDF-')
+    response.close()
+
+def test_streamed_requests_are_counted_once(client):
+    def converted():
+        return converter.requests_total[('convert_images_to_pdf', 200)]
+
+    before = converted()
+    in_flight = converter.requests_in_flight
+    for _ in range(3):
+        data = {'images': [(io.BytesIO(png_bytes(i)), f'page{i}.png') for i in range(3)]}
+        response = client.post('/convert_images', data=data, content_type='multipart/form-data')
+        response.get_data()
+        response.close()
+
+    assert converted() - before == 3
+    assert converter.requests_in_flight == in_flight
+
+@pytest.fixture
+def job_client(client, tmp_path, monkeypatch):
+    # Jobs are queued but not run, so the test only covers accepting them
+    monkeypatch.setitem(converter.app.config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    monkeypatch.setitem(converter.app.config, 'JOB_WORKERS', 0)
+    monkeypatch.setattr(converter, 'job_queue', converter.queue.Queue(maxsize=8))
+    return client
+
+def test_job_accepts_more_parts_than_the_form(job_client):
+    image = png_bytes(0)
+    data = {'images': [(io.BytesIO(image), f'page{i}.png') for i in range(1200)]}
+
+    response = job_client.post('/jobs', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 202
+    assert len(converter.jobs[response.get_json()['id']].filenames) == 1200
+
+def test_job_over_part_limit_gets_json_error(job_client, monkeypatch):
+    monkeypatch.setitem(converter.app.config, 'JOB_MAX_FORM_PARTS', 5)
+    data = {'images': [(io.BytesIO(png_bytes(i)), f'page{i}.png') for i in range(10)]}
+
+    response = job_client.post('/jobs', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 413
+    assert 'error' in response.get_json()
+
+def multipart_body(boundary, parts):
+    """Encodes (name, filename or None, data) parts in the order given."""
+    body = b''
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else '')
+        body += f'--{boundary}\r\nContent-Disposition: {disposition}\r\n\r\n'.encode() + data + b'\r\n'
+    return body + f'--{boundary}--\r\n'.encode()
+
+@pytest.mark.parametrize('field, value, accepted', [
+    ('output', 'zip', True),
+    ('page_size', 'original', True),
+    ('output', 'merged', False),
+    ('page_size', 'a4', False),
+])
+def test_streamed_fields_after_images(client, monkeypatch, field, value, accepted):
+    monkeypatch.setitem(converter.app.config, 'STREAM_UPLOADS', True)
+    body = multipart_body('x-boundary', [('images', 'page0.png', png_bytes(0)), (field, None, value.encode())])
+
+    response = client.post('/convert_images', data=body, content_type='multipart/form-data; boundary=x-boundary')
+
+    assert (b'Form fields must be sent before the images.' not in response.get_data()) == accepted
+    assert (response.mimetype == 'application/zip') == accepted
+    response.close()
+
+def image_bytes(size, image_format, mode='RGB', **save_args):
+    out = io.BytesIO()
+    Image.new(mode, size, 'white').save(out, image_format, **save_args)
+    return out.getvalue()
+
+def media_boxes(pdf):
+    return [tuple(round(float(n)) for n in box.split())
+            for box in re.findall(rb'/MediaBox \[0 0 ([\d.]+ [\d.]+)\]', pdf)]
+
+@pytest.mark.parametrize('image_format', ['JPEG', 'PNG'])
+@pytest.mark.parametrize('size, page', [
+    ((1000, 1000), (595, 842)),
+    ((3000, 1000), (842, 595)),
+])
+def test_page_size_sets_the_page(image_format, size, page):
+    options = converter.conversion_options({'page_size': 'a4'})
+
+    pdf = converter.convert_image_to_pdf(image_bytes(size, image_format), options)
+
+    assert media_boxes(pdf) == [page]
+
+def write_job(job_id, pid, created):
+    os.makedirs(converter.job_dir(job_id))
+    with open(converter.job_input_path(job_id, 0), 'wb') as f:
+        f.write(png_bytes(0))
+    job = converter.Job(job_id, ['page0.png'], [1], 'zip', converter.conversion_options())
+    job.status, job.pid, job.created = 'running', pid, created
+    converter.save_job_state(job_id, job.to_dict())
+
+def test_abandoned_jobs_are_failed(job_client, monkeypatch):
+    finished = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                              capture_output=True, text=True, check=True)
+    write_job('a' * 32, int(finished.stdout), time.time())
+    write_job('b' * 32, os.getppid(), time.time())
+    write_job('c' * 32, os.getppid(), time.time() - converter.app.config['JOB_MAX_AGE'] - 1)
+    monkeypatch.setattr(converter, '_last_job_sweep', 0.0)
+
+    converter.expire_jobs()
+
+    statuses = {job_id[0]: converter.load_job_state(job_id)['status'] for job_id in ('a' * 32, 'b' * 32, 'c' * 32)}
+    assert statuses == {'a': 'failed', 'b': 'running', 'c': 'failed'}
+    assert not os.path.exists(converter.job_input_path('a' * 32, 0))
+    assert os.path.exists(converter.job_input_path('b' * 32, 0))
+
+def metric(text, name):
+    return float(re.search(rf'^{re.escape(name)} (\S+)$', text, re.M).group(1))
+
+def scrape(client):
+    response = client.get('/metrics')
+    text = response.get_data(as_text=True)
+    response.close()
+    return text
+
+def test_metrics_add_up_pre_forked_workers(client, tmp_path, monkeypatch):
+    folder = tmp_path / 'metrics'
+    folder.mkdir()
+    monkeypatch.setitem(converter.app.config, 'METRICS_FOLDER', str(folder))
+    name = 'bulkjpgtopdf_requests_total{endpoint="index",status="200"}'
+    other = converter.metrics_state()
+    other['requests_total'] = [['index', 200, 5]]
+    other['requests_in_flight'] = 2
+    converter.write_metrics_file(converter.worker_metrics_path(1), other)
+    own = metric(scrape(client), 'bulkjpgtopdf_requests_in_flight')
+
+    text = scrape(client)
+    assert metric(text, name) >= 5
+    assert metric(text, 'bulkjpgtopdf_requests_in_flight') == own
+
+    # A worker that exits keeps its counts but no longer has requests in flight
+    before = metric(text, name)
+    converter.retire_worker_metrics(1)
+    text = scrape(client)
+    assert not os.path.exists(converter.worker_metrics_path(1))
+    assert metric(text, name) == before
+    assert metric(text, 'bulkjpgtopdf_requests_in_flight') == own - 2
+
+@pytest.mark.parametrize('page_order', ['upload', 'name'])
+def test_streamed_upload_limits_conversions_in_flight(client, monkeypatch, page_order):
+    monkeypatch.setitem(converter.app.config, 'STREAM_UPLOADS', True)
+    counts = {'submitted': 0, 'in_flight': 0, 'peak': 0}
+    submit, result = converter.ConversionBatch.submit, converter.ConversionBatch.result
+
+    def counting_submit(self, data):
+        counts['submitted'] += 1
+        counts['in_flight'] += 1
+        counts['peak'] = max(counts['peak'], counts['in_flight'])
+        return submit(self, data)
+
+    def counting_result(self, handle):
+        counts['in_flight'] -= 1
+        return result(self, handle)
+
+    monkeypatch.setattr(converter.ConversionBatch, 'submit', counting_submit)
+    monkeypatch.setattr(converter.ConversionBatch, 'result', counting_result)
+    # Uploaded in reverse, so ordering by name puts the held images first
+    names = [f'page{i}.png' for i in reversed(range(6))]
+    data = {'page_order': page_order,
+            'images': [(io.BytesIO(png_bytes(i)), name) for i, name in enumerate(names)]}
+
+    response = client.post('/convert_images', data=data, content_type='multipart/form-data')
+
+    with zipfile.ZipFile(io.BytesIO(response.get_data())) as zf:
+        expected = names if page_order == 'upload' else sorted(names)
+        assert zf.namelist() == [name.replace('.png', '.pdf') for name in expected]
+    assert counts['submitted'] == 6
+    assert counts['peak'] == 2
+    response.close()
+
+def test_streamed_upload_over_part_limit(client, monkeypatch):
+    monkeypatch.setitem(converter.app.config, 'STREAM_UPLOADS', True)
+    monkeypatch.setitem(converter.app.config, 'MAX_FORM_PARTS', 5)
+    data = {'images': [(io.BytesIO(png_bytes(i)), f'page{i}.png') for i in range(10)]}
+
+    response = client.post('/convert_images', data=data, content_type='multipart/form-data')
+
+    assert response.status_code == 413
+    response.close()
+
+@pytest.mark.parametrize('mode, save_args, components', [
+    ('RGB', {}, 3),
+    ('RGB', {'progressive': True}, 3),
+    ('L', {}, 1),
+])
+def test_jpeg_header_of_embeddable_jpegs(mode, save_args, components):
+    data = image_bytes((40, 30), 'JPEG', mode, **save_args)
+
+    assert converter.read_jpeg_header(data) == converter.JpegInfo(40, 30, components)
+    # Embedded as uploaded, without re-encoding
+    assert data in converter.convert_image_to_pdf(data, converter.conversion_options())
+
+def test_cmyk_jpeg_goes_through_pillow():
+    data = image_bytes((40, 30), 'JPEG', 'CMYK')
+
+    assert converter.read_jpeg_header(data) is None
+    pdf = converter.convert_image_to_pdf(data, converter.conversion_options())
+    assert data not in pdf
+    assert b'/ColorSpace /DeviceRGB' in pdf
+
+def test_truncated_jpeg_is_not_embedded():
+    out = io.BytesIO()
+    Image.effect_noise((200, 200), 64).convert('RGB').save(out, 'JPEG')
+    data = out.getvalue()[:len(out.getvalue()) // 2]
+
+    assert converter.read_jpeg_header(data) is None
+    _, error, _ = converter.convert_upload(data, converter.conversion_options())
+    assert error is not None
+
+def test_merged_pdf_xref_offsets():
+    options = converter.conversion_options()
+    images = [image_bytes((40, 30), 'JPEG'), png_bytes(1), image_bytes((20, 50), 'JPEG', 'L')]
+    out = io.BytesIO()
+    for _ in converter.write_merged_pdf(out, (converter.convert_upload_page(data, options)[0] for data in images)):
+        pass
+    pdf = out.getvalue()
+
+    xref_offset = int(re.search(rb'startxref\n(\d+)\n%%EOF\n$', pdf).group(1))
+    assert pdf[xref_offset:].startswith(b'xref\n')
+    size = int(re.match(rb'xref\n0 (\d+)\n', pdf[xref_offset:]).group(1))
+    entries = re.findall(rb'(\d{10}) (\d{5}) ([fn]) \n', pdf[xref_offset:])
+    assert len(entries) == size == 3 * len(images) + 3
+    for number, (offset, _, kind) in enumerate(entries[1:], start=1):
+        assert kind == b'n'
+        assert pdf[int(offset):].startswith(f'{number} 0 obj\n'.encode())
+    assert pdf.count(b'/Type /Page ') == len(images)
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+import cli
+
+def run_cli(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['cli.py', *args])
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main()
+    return exit_info.value.code
+
+def test_images_sharing_a_pdf_name_are_reported(tmp_path, monkeypatch, capsys):
+    Image.new('RGB', (8, 8), 'red').save(tmp_path / 'scan.jpg')
+    Image.new('RGB', (8, 8), 'blue').save(tmp_path / 'scan.png')
+
+    for _ in range(2):
+        # The second run must report the collision again rather than call it up to date
+        assert run_cli(monkeypatch, str(tmp_path), '--workers', '1') == 1
+        output = capsys.readouterr()
+        assert 'scan.png' in output.err
+        assert '1 failed' in output.out
+
+    assert sorted(os.listdir(tmp_path)) == ['scan.jpg', 'scan.pdf', 'scan.png']
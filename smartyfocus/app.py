@@ -2,50 +2,181 @@ import tkinter as tk
 from tkinter import messagebox
 from tkinter import ttk
 import cv2
+import numpy as np
 import time
+import math
+import queue
 import threading
-import pygetwindow as gw
+import multiprocessing
+from multiprocessing import shared_memory
+try:
+    import pygetwindow as gw
+except NotImplementedError:
+    # No window support on this platform (Linux); the headless replay still works
+    gw = None
 import mediapipe as mp
 from PIL import Image, ImageTk
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import os
 import io
+import re
+import sys
+import json
+import ctypes
+import types
+import logging
+import sqlite3
+import platform
+import datetime
+import functools
 import collections
+from array import array
+from contextlib import closing, contextmanager
+from logging.handlers import RotatingFileHandler
 
 # --- Global Variables ---
-focused_time = 0
-distracted_time = 0
+# Tracking counters and face state live in `tracking_state` below
 target_app_titles = []  # Changed to a list for multiple app titles
-tracking_active = False
-face_detected_in_frame = False
-head_facing_forward = False
 # Variables for video capture and frame handling
-cap = None
-frame_buffer = []
-# Locks for thread-safe access
+CAMERA_INDEX = 0
+CAMERA_WIDTH = 640  # Requested capture size; None keeps the camera's default
+CAMERA_HEIGHT = 480
+CAMERA_FPS = 30  # Requested capture rate; None keeps the camera's default
+CAMERA_FOURCC = 'MJPG'  # Requested pixel format, e.g. 'MJPG' or 'YUYV'; None keeps the camera's default
+CAMERA_BUFFER_SIZE = 1  # Frames OpenCV may queue inside the driver
+# Lock for the graph data; the rest of the tracking state is published as snapshots
 lock = threading.Lock()
 stop_event = threading.Event()
-# Lists to store data for the graph
-focus_data = [] # Stores tuples of (timestamp, focused_time)
-distraction_data = [] # Stores tuples of (timestamp, distracted_time)
-# Dictionary to store distraction time per application
-distraction_per_app = collections.defaultdict(float)
+webcam_thread = None  # The running webcam_loop thread, if any
+WEBCAM_STOP_TIMEOUT = 4.0  # Seconds to wait on quit for webcam_loop to drain the engine and end the session
+# Data for the graph: cumulative focused and distracted time over the session
+# (seconds per sample, samples kept) for each resolution, finest first
+SERIES_RESOLUTIONS = ((1, 6 * 3600), (60, 7 * 24 * 60), (900, 365 * 96))
+GRAPH_MAX_POINTS = 1000  # Points per line the graph is downsampled to
+# Session history kept across runs
+EVENT_DB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'focus_history.db')
+EVENT_FLUSH_INTERVAL = 1.0  # Seconds the writer collects intervals before committing them
+REPORT_RANGES = {"This session": None, "Today": 0, "Last 7 days": 7, "Last 30 days": 30}  # Days back from midnight
 start_time = time.time()
 # Pomodoro timer variables
-pomodoro_minutes = 25
-pomodoro_seconds = 0
-pomodoro_running = False
-pomodoro_paused = False
-pomodoro_thread = None
+POMODORO_SECONDS = 25 * 60
+POMODORO_HOLD_CHECK_INTERVAL = 0.25  # Seconds between focus checks while the timer holds
 # Gamification variables
 focus_session_count = 0
 # Variables for dynamic video display
-last_frame = None
+PREVIEW_FPS = 15.0  # Most frames per second shown in the live webcam view
+ENGINE_PROCESS = True  # Run capture and face detection in a worker process instead of a thread
+PREVIEW_RING_SLOTS = 3  # Preview frames kept in shared memory for the GUI process
+PREVIEW_MAX_WIDTH = 1920  # Largest preview the shared memory ring holds
+PREVIEW_MAX_HEIGHT = 1080
+# Performance telemetry
+TELEMETRY_WINDOW = 300  # Latest samples per stage the percentiles are taken over
+TELEMETRY_INTERVAL = 1.0  # Seconds between summaries from the tracking engine
+TELEMETRY_EXPORT_INTERVAL = 10.0  # Seconds between lines in the telemetry file; None turns export off
+TELEMETRY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'telemetry.jsonl')
+TELEMETRY_MAX_BYTES = 5 * 1024 * 1024  # Size at which the telemetry file is rotated
+TELEMETRY_BACKUP_COUNT = 3  # Rotated telemetry files kept
+show_telemetry = False  # Show the performance panel in the main window
+# Inference scheduling: FaceMesh runs at an adaptive rate instead of on every frame
+INFERENCE_TARGET_FPS = 5.0  # Rate while the focus state is stable
+INFERENCE_MAX_FPS = 15.0  # Rate right after the face state changes
+INFERENCE_MIN_FPS = 2.0  # Rate once the state has been stable for a long time
+INFERENCE_BOOST_SECONDS = 2.0  # How long the max rate is kept after a change
+INFERENCE_RELAX_SECONDS = 30.0  # Stable time after which the rate drops to the minimum
+ROI_ENABLED = True  # Run FaceMesh on a crop around the last known face
+ROI_MARGIN = 0.5  # Space added around the face box, as a fraction of its size
+HEAD_FORWARD_THRESHOLD = 0.15  # Nose tip distance from the frame center, as a fraction of its width
+# Detector cascade: a cheap face detection first, FaceMesh only when it is needed
+CASCADE_ENABLED = True
+DETECTION_WIDTH = 320  # Width the frame is scaled down to for face detection
+NOSE_AMBIGUITY = 0.04  # FaceMesh confirms detections whose nose is this close to the threshold
+show_landmarks = True  # Draw the face mesh on the live video; the cascade skips FaceMesh when off
+# Active window tracking: one thread queries the window manager for everyone else
+WINDOW_POLL_INTERVAL = 0.25  # Seconds between queries when focus-change events are not available
+WINDOW_TITLE_POLL_INTERVAL = 1.0  # Seconds between queries for title changes when events are available
+# Window title classification
+APP_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app_rules.json')  # Extra rules, optional
+TITLE_CACHE_SIZE = 1024  # Window titles whose classification is remembered
+# (app name, regular expression) pairs, matched case-insensitively against window titles
+DEFAULT_APP_RULES = [
+    ("Google Chrome", r"\bgoogle chrome\b|\bchrome\b"),
+    ("Mozilla Firefox", r"\bfirefox\b"),
+    ("Visual Studio Code", r"\bvisual studio code\b|\bvs ?code\b"),
+    ("Microsoft Word", r"\bmicrosoft word\b|- word$"),
+    ("Microsoft Excel", r"\bmicrosoft excel\b|- excel$"),
+    ("Microsoft PowerPoint", r"\bpowerpoint\b"),
+    ("File Explorer", r"\bfile explorer\b"),
+    ("Spotify", r"\bspotify\b"),
+    ("Terminal", r"\bterminal\b|\bcmd(?:\.exe)?\b|\bcommand prompt\b|\bpowershell\b"),
+]
+
+# --- Tracking State ---
+class TrackingSnapshot:
+    """The tracking state at one moment. Immutable, so readers can keep it as long as they like."""
+    __slots__ = ('seq', 'tracking_active', 'face_detected', 'head_facing_forward', 'focused',
+                 'focused_time', 'distracted_time', 'distraction_per_app')
+
+    def __init__(self, seq=0, tracking_active=False, face_detected=False, head_facing_forward=False, focused=False,
+                 focused_time=0.0, distracted_time=0.0, distraction_per_app=types.MappingProxyType({})):
+        for name, value in zip(self.__slots__, (seq, tracking_active, face_detected, head_facing_forward, focused,
+                                                focused_time, distracted_time, distraction_per_app)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TrackingSnapshot is immutable")
+
+    def replace(self, **changes):
+        """Returns the next snapshot, with `changes` applied."""
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        values['seq'] = self.seq + 1
+        return TrackingSnapshot(**values)
+
+class TrackingState:
+    """
+    Holds the current TrackingSnapshot. Only webcam_loop writes; it builds
+    each new snapshot on its own and publishes it with one reference
+    assignment, so readers never take a lock and never see counters from
+    two different moments.
+    """
+    __slots__ = ('snapshot', 'last_check', '_distraction_per_app')
+
+    def __init__(self):
+        self.snapshot = TrackingSnapshot()
+        self.last_check = 0.0  # Time up to which focus time has been counted
+        self._distraction_per_app = collections.defaultdict(float)
+
+    def publish(self, **changes):
+        self.snapshot = self.snapshot.replace(**changes)
+
+    def reset(self, start, **changes):
+        """Starts a new run at time `start` with all counters at zero."""
+        self.last_check = start
+        self._distraction_per_app.clear()
+        self.snapshot = TrackingSnapshot(seq=self.snapshot.seq + 1).replace(**changes)
+
+    def add_focus_time(self, delta_time, is_focused, app_name, **changes):
+        """Adds `delta_time` to the focused or distracted totals and publishes them with `changes`."""
+        snapshot = self.snapshot
+        if is_focused:
+            self.publish(focused=True, focused_time=snapshot.focused_time + delta_time, **changes)
+            return
+        # --- FIX: Use the normalized app name for the dictionary key ---
+        if app_name:
+            self._distraction_per_app[app_name] += delta_time
+        else:
+            self._distraction_per_app["(No Active Window)"] += delta_time
+        self.publish(focused=False, distracted_time=snapshot.distracted_time + delta_time,
+                     distraction_per_app=types.MappingProxyType(dict(self._distraction_per_app)), **changes)
+
+tracking_state = TrackingState()
 
 # --- Helper Functions ---
 def get_active_window_title():
     """Gets the title of the currently active window."""
+    if gw is None:
+        return ""
     try:
         active_window = gw.getActiveWindow()
         if active_window:
@@ -58,6 +189,9 @@ def get_active_window_title():
 def list_windows():
     """Populates the listbox with titles of open windows."""
     app_listbox.delete(0, tk.END)
+    if gw is None:
+        messagebox.showerror("Error", "Listing windows is not supported on this platform.")
+        return
     try:
         open_windows = [title for title in gw.getAllTitles() if title.strip()]
         if not open_windows:
@@ -68,115 +202,1193 @@ def list_windows():
     except Exception as e:
         messagebox.showerror("Error", f"Could not list open windows: {e}")
 
-def get_normalized_app_name(window_title):
+def normalize_title(title):
+    """Returns the form window titles are compared in."""
+    return title.strip().lower()
+
+def load_app_rules(path=APP_RULES_FILE):
     """
-    Normalizes a window title to a common application name.
-    This helps group time for different windows of the same application.
+    Returns the rules from `path` followed by the default rules. The file holds
+    a JSON list of {"app": name, "pattern": regular expression} objects. Rules
+    whose pattern does not compile are skipped.
     """
-    title_lower = window_title.strip().lower()
-    
-    if "chrome" in title_lower:
-        return "Google Chrome"
-    elif "firefox" in title_lower:
-        return "Mozilla Firefox"
-    elif "code" in title_lower:
-        return "Visual Studio Code"
-    elif "word" in title_lower:
-        return "Microsoft Word"
-    elif "excel" in title_lower:
-        return "Microsoft Excel"
-    elif "powerpoint" in title_lower:
-        return "Microsoft PowerPoint"
-    elif "file explorer" in title_lower:
-        return "File Explorer"
-    elif "spotify" in title_lower:
-        return "Spotify"
-    elif "terminal" in title_lower or "cmd" in title_lower or "powershell" in title_lower:
-        return "Terminal"
-    # Add more common applications here
-    
-    # Return the original title if no match is found
-    return window_title
+    rules = []
+    if os.path.exists(path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                rules = [(rule['app'], rule['pattern']) for rule in json.load(f)]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Ignoring app rules in {path}: {e}")
+            rules = []
+    valid_rules = []
+    for app_name, pattern in rules:
+        try:
+            groups = re.compile(pattern).groupindex
+        except (re.error, TypeError) as e:
+            print(f"Ignoring app rules in {path}: pattern for {app_name!r}: {e}")
+            continue
+        if any(RULE_GROUP.fullmatch(name) for name in groups):
+            # TitleClassifier names its own groups like this
+            print(f"Ignoring app rules in {path}: pattern for {app_name!r} uses a reserved group name")
+            continue
+        valid_rules.append((app_name, pattern))
+    return valid_rules + DEFAULT_APP_RULES
+
+# Names of the groups TitleClassifier wraps each rule in
+RULE_GROUP = re.compile(r'rule\d+')
+
+class TitleClassifier:
+    """
+    Classifies window titles into (app name, is target). The app rules are
+    compiled into one regular expression, so a title is scanned once however
+    many rules there are; the rule matching earliest in the title wins. Results
+    are cached per title, since the same few titles come up over and over.
+    """
+    def __init__(self, rules, targets=()):
+        self.app_names = [name for name, _ in rules]
+        alternatives = '|'.join(f'(?P<rule{i}>{pattern})' for i, (_, pattern) in enumerate(rules))
+        self.pattern = re.compile(alternatives, re.IGNORECASE) if rules else None
+        self.targets = frozenset(normalize_title(title) for title in targets)
+        self.classify = functools.lru_cache(maxsize=TITLE_CACHE_SIZE)(self._classify)
+
+    def with_targets(self, targets):
+        """Returns a classifier with the same rules and new target titles."""
+        classifier = TitleClassifier([], targets)
+        classifier.app_names = self.app_names
+        classifier.pattern = self.pattern
+        return classifier
+
+    def _classify(self, title):
+        app_name = title
+        match = self.pattern.search(title) if self.pattern else None
+        if match:
+            app_name = self.app_names[int(match.lastgroup[len('rule'):])]
+        return app_name, normalize_title(title) in self.targets
+
+title_classifier = TitleClassifier(load_app_rules())
+
+@contextmanager
+def timed(timings, stage):
+    """
+    Records the time spent in the block: as [count, seconds] in timings[stage]
+    if timings is a dict, or as a sample if it is a StageTelemetry. Does
+    nothing if timings is None.
+    """
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if isinstance(timings, dict):
+            entry = timings.setdefault(stage, [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+        else:
+            timings.observe(stage, elapsed)
+
+def account_focus(now, face_state, title, timings=None):
+    """
+    Counts the time since the last check as focused or distracted, judged by
+    the face state it had and the active window `title`, then publishes
+    `face_state`, a (face detected, head facing forward) pair, or keeps the
+    current one if it is None. Returns (app name, is focused) for the time
+    just counted.
+    """
+    with timed(timings, 'window'):
+        app_name, is_focused_on_app = title_classifier.classify(title)
+    snapshot = tracking_state.snapshot
+    is_focused = snapshot.face_detected and snapshot.head_facing_forward and is_focused_on_app
+    changes = {}
+    if face_state is not None:
+        changes['face_detected'], changes['head_facing_forward'] = face_state
+    tracking_state.add_focus_time(now - tracking_state.last_check, is_focused, app_name, **changes)
+    tracking_state.last_check = now
+    return app_name, is_focused
+
+# --- Telemetry ---
+def process_rss():
+    """Returns the resident memory of this process in bytes, or None if it cannot be read."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class StageTelemetry:
+    """
+    Rolling latency samples per stage and event counts, summarized every few
+    seconds. Recording is an append to a bounded deque, cheap enough to stay on.
+    """
+    def __init__(self, window=TELEMETRY_WINDOW):
+        self.window = window
+        self.samples = {}  # stage -> deque of the latest durations in seconds
+        self.events = collections.Counter()  # Events since the last summary
+        self._last_wall = time.monotonic()
+        self._last_cpu = time.process_time()
+
+    def observe(self, stage, seconds):
+        samples = self.samples.get(stage)
+        if samples is None:
+            samples = self.samples.setdefault(stage, collections.deque(maxlen=self.window))
+        samples.append(seconds)
+
+    def count(self, event, n=1):
+        self.events[event] += n
+
+    @staticmethod
+    def _percentile(ordered, fraction):
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+    def summary(self):
+        """Returns p50/p95 per stage, event rates since the last summary, and this process's CPU and memory."""
+        now = time.monotonic()
+        cpu = time.process_time()
+        elapsed = max(now - self._last_wall, 1e-6)
+        stages = {}
+        for stage, samples in list(self.samples.items()):
+            ordered = sorted(samples)
+            if ordered:
+                stages[stage] = {'p50_ms': self._percentile(ordered, 0.5) * 1000,
+                                 'p95_ms': self._percentile(ordered, 0.95) * 1000}
+        events, self.events = self.events, collections.Counter()
+        summary = {
+            'stages': stages,
+            'rates': {event: n / elapsed for event, n in events.items()},
+            'pid': os.getpid(),
+            'cpu_percent': (cpu - self._last_cpu) / elapsed * 100,
+            'rss_bytes': process_rss(),
+        }
+        self._last_wall = now
+        self._last_cpu = cpu
+        return summary
+
+gui_telemetry = StageTelemetry()
+telemetry_report = None  # Latest combined engine and GUI summary
+shown_telemetry = None  # Report the performance panel shows
+
+def telemetry_logger():
+    """Returns the logger that writes telemetry to the rotating JSON lines file."""
+    logger = logging.getLogger('smartyfocus.telemetry')
+    if not logger.handlers:
+        handler = RotatingFileHandler(TELEMETRY_FILE, maxBytes=TELEMETRY_MAX_BYTES, backupCount=TELEMETRY_BACKUP_COUNT,
+                                      encoding='utf-8', delay=True)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+def format_telemetry(report):
+    """Formats a telemetry report for the overlay panel."""
+    engine, gui = report['engine'], report['gui']
+    capture = engine['capture']
+    lines = [
+        f"capture {capture['capture_fps']:.1f} fps, dropped {capture['dropped']}, "
+        f"frame age {capture['last_frame_age'] * 1000:.0f} ms",
+        f"inference {engine['rates'].get('inferences', 0.0):.1f} fps, "
+        f"preview {engine['rates'].get('previews', 0.0):.1f} fps, shown {gui['rates'].get('frames_shown', 0.0):.1f} fps",
+        f"window {'events' if report['window_events'] else 'polling'}, "
+        f"{gui['rates'].get('window_queries', 0.0):.1f} queries/s",
+    ]
+    for source in (engine, gui):
+        for stage, stats in source['stages'].items():
+            lines.append(f"{stage:15} p50 {stats['p50_ms']:6.1f} ms  p95 {stats['p95_ms']:6.1f} ms")
+    # With the engine on a thread both summaries describe the same process
+    sources = (('engine', engine), ('gui', gui)) if engine['pid'] != gui['pid'] else (('process', gui),)
+    for name, source in sources:
+        rss = source['rss_bytes']
+        lines.append(f"{name} cpu {source['cpu_percent']:.0f}%" + (f", rss {rss / 2 ** 20:.0f} MB" if rss else ""))
+    return "\n".join(lines)
+
+# --- Active Window Tracking ---
+WindowSnapshot = collections.namedtuple('WindowSnapshot', 'title changed_at')
+
+class WindowFocusProvider:
+    """
+    Tracks the active window on a background thread and publishes it as an
+    immutable WindowSnapshot in `snapshot`, so readers never wait on the
+    window manager. On Windows it listens for foreground-change events and only
+    polls slowly for title changes within a window; elsewhere it polls.
+    """
+    EVENT_SYSTEM_FOREGROUND = 0x0003
+    WINEVENT_OUTOFCONTEXT = 0x0000
+    PM_REMOVE = 0x0001
+
+    def __init__(self, poll_interval=WINDOW_POLL_INTERVAL, title_poll_interval=WINDOW_TITLE_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.title_poll_interval = title_poll_interval
+        self.snapshot = WindowSnapshot("", time.time())
+        self.uses_events = False  # Reported with the telemetry
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts the tracking thread if it is not running yet."""
+        if self._thread is None:
+            self._refresh()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _refresh(self):
+        """Queries the active window and publishes a new snapshot if its title changed."""
+        with timed(gui_telemetry, 'window'):
+            title = get_active_window_title()
+        gui_telemetry.count('window_queries')
+        if title != self.snapshot.title:
+            self.snapshot = WindowSnapshot(title, time.time())
+
+    def _run(self):
+        if sys.platform == 'win32':
+            try:
+                self._run_with_events()
+                return
+            except (AttributeError, OSError) as e:
+                print(f"Focus-change events are not available, polling instead: {e}")
+        while not self._stop.wait(self.poll_interval):
+            self._refresh()
+
+    def _run_with_events(self):
+        """Refreshes on foreground-change events; the hook lives as long as this thread pumps messages."""
+        from ctypes import wintypes
+        user32 = ctypes.windll.user32
+        WinEventProc = ctypes.WINFUNCTYPE(None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND,
+                                          wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD)
+        callback = WinEventProc(lambda *args: self._refresh())
+        hook = user32.SetWinEventHook(self.EVENT_SYSTEM_FOREGROUND, self.EVENT_SYSTEM_FOREGROUND,
+                                      None, callback, 0, 0, self.WINEVENT_OUTOFCONTEXT)
+        if not hook:
+            raise OSError("SetWinEventHook failed")
+        self.uses_events = True
+        message = wintypes.MSG()
+        last_poll = time.monotonic()
+        try:
+            while not self._stop.wait(0.05):
+                # Out-of-context hooks are called while this thread retrieves messages
+                while user32.PeekMessageW(ctypes.byref(message), None, 0, 0, self.PM_REMOVE):
+                    user32.TranslateMessage(ctypes.byref(message))
+                    user32.DispatchMessageW(ctypes.byref(message))
+                # Tab switches change the title without a foreground event
+                if time.monotonic() - last_poll >= self.title_poll_interval:
+                    last_poll = time.monotonic()
+                    self._refresh()
+        finally:
+            user32.UnhookWinEvent(hook)
+
+window_provider = WindowFocusProvider()
+
+# --- Video Capture ---
+class FrameGrabber:
+    """
+    Reads the webcam on its own thread and keeps only the newest frame, so
+    the tracking loop always works on what the camera sees now instead of a
+    frame that sat in a queue while the previous one was being analyzed.
+    """
+    def __init__(self, index=CAMERA_INDEX, width=CAMERA_WIDTH, height=CAMERA_HEIGHT, fps=CAMERA_FPS,
+                 fourcc=CAMERA_FOURCC, buffer_size=CAMERA_BUFFER_SIZE):
+        self.index = index
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.fourcc = fourcc
+        self.buffer_size = buffer_size
+        self.capture = None
+        self.captured = 0  # Frames read from the camera
+        self.dropped = 0  # Frames replaced by a newer one before anyone took them
+        self.delivered = 0  # Frames handed to the tracking loop
+        self.capture_fps = 0.0
+        self.last_frame_age = 0.0  # Seconds between capture and hand-over of the last frame
+        self._frame_age_total = 0.0
+        self._frame = None
+        self._captured_at = 0.0
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def open(self):
+        """Opens the camera with the requested format. Returns False if it cannot be opened."""
+        self.capture = cv2.VideoCapture(self.index)
+        if not self.capture.isOpened():
+            return False
+        # The pixel format goes first; some backends reset it when the size changes
+        if self.fourcc:
+            self.capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc))
+        if self.width and self.height:
+            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if self.fps:
+            self.capture.set(cv2.CAP_PROP_FPS, self.fps)
+        if self.buffer_size:
+            self.capture.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+        print(f"Camera opened at {self.describe_format()}")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return True
+
+    def describe_format(self):
+        """Returns the format the camera actually agreed to."""
+        fourcc = int(self.capture.get(cv2.CAP_PROP_FOURCC))
+        fourcc_text = ''.join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)).strip('\x00') or 'default'
+        return (f"{int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))} "
+                f"{self.capture.get(cv2.CAP_PROP_FPS):.0f} fps {fourcc_text}")
+
+    def _run(self):
+        window_start = time.time()
+        window_frames = 0
+        while not self._stop.is_set():
+            ret, frame = self.capture.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            now = time.time()
+            with self._condition:
+                if self._frame is not None:
+                    self.dropped += 1
+                self._frame = frame
+                self._captured_at = now
+                self.captured += 1
+                self._condition.notify()
+            window_frames += 1
+            if now - window_start >= 1.0:
+                self.capture_fps = window_frames / (now - window_start)
+                window_start = now
+                window_frames = 0
+
+    def read(self, timeout=1.0):
+        """Returns (frame, capture time) for the newest frame not taken yet, or (None, None) after `timeout`."""
+        with self._condition:
+            if self._frame is None:
+                self._condition.wait(timeout)
+            if self._frame is None:
+                return None, None
+            frame, captured_at = self._frame, self._captured_at
+            self._frame = None
+        self.delivered += 1
+        self.last_frame_age = time.time() - captured_at
+        self._frame_age_total += self.last_frame_age
+        return frame, captured_at
+
+    def stats(self):
+        """Returns the capture counters."""
+        return {
+            'captured': self.captured,
+            'dropped': self.dropped,
+            'delivered': self.delivered,
+            'capture_fps': self.capture_fps,
+            'last_frame_age': self.last_frame_age,
+            'mean_frame_age': self._frame_age_total / self.delivered if self.delivered else 0.0,
+        }
+
+    def release(self):
+        """Stops the capture thread and closes the camera."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        if self.capture is not None:
+            self.capture.release()
+
+# --- Live Preview ---
+class PreviewBuffer:
+    """
+    Hands frames from the webcam thread to the GUI. The webcam side scales each
+    frame it publishes to the size of the video label and converts it to RGB
+    into one of three preallocated buffers; the GUI takes the newest one. The
+    two sides only share a lock for swapping buffers, never while copying
+    pixels, and frames come through at most PREVIEW_FPS times a second.
+    """
+    def __init__(self, fps=PREVIEW_FPS):
+        self.interval = 1.0 / fps
+        self.size = None  # (width, height) of the video label
+        self.seq = 0  # Number of the last published frame
+        self._next_publish = 0.0
+        self._buffers = None
+        self._back, self._ready, self._front = 0, 1, 2
+        self._fresh = False
+        self._swap_lock = threading.Lock()
+
+    def set_size(self, width, height):
+        """Called by the GUI with the current size of the video label."""
+        if width > 1 and height > 1:
+            self.size = (width, height)
+
+    def is_due(self, now):
+        """True if a frame captured at `now` should be published."""
+        return self.size is not None and now >= self._next_publish
+
+    def publish(self, frame, now):
+        """Scales and converts `frame` into the back buffer and makes it the newest frame."""
+        self._next_publish = now + self.interval
+        width, height = self.size
+        if self._buffers is None or self._buffers[0].shape[:2] != (height, width):
+            with self._swap_lock:
+                self._buffers = [np.empty((height, width, 3), np.uint8) for _ in range(3)]
+                self._fresh = False
+        back = self._buffers[self._back]
+        scaled = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(scaled, cv2.COLOR_BGR2RGB, dst=back)
+        with self._swap_lock:
+            self._back, self._ready = self._ready, self._back
+            self._fresh = True
+            self.seq += 1
+
+    def latest(self, seen_seq):
+        """Returns (seq, RGB frame) if a frame newer than `seen_seq` was published, otherwise None."""
+        with self._swap_lock:
+            if not self._fresh or self.seq == seen_seq:
+                return None
+            self._front, self._ready = self._ready, self._front
+            self._fresh = False
+            return self.seq, self._buffers[self._front]
+
+    def latest_image(self, seen_seq):
+        """Returns (seq, PIL image) if a frame newer than `seen_seq` was published, otherwise None."""
+        latest = self.latest(seen_seq)
+        if latest is None:
+            return None
+        seq, frame = latest
+        return seq, Image.fromarray(frame)
+
+class SharedFrameRing:
+    """
+    Preview frames in shared memory, for a tracking engine running in another
+    process. Has the same interface as PreviewBuffer. The engine scales and
+    converts each frame straight into the next of a few slots; the GUI reads
+    the newest slot in place and checks afterwards that it was not
+    overwritten while it was being read.
+    """
+    # Header: published seq, requested width, requested height, then seq, width, height per slot
+    HEADER_FIELDS = 3
+    SLOT_FIELDS = 3
+
+    def __init__(self, shm, owner, fps=PREVIEW_FPS, slots=PREVIEW_RING_SLOTS,
+                 max_width=PREVIEW_MAX_WIDTH, max_height=PREVIEW_MAX_HEIGHT):
+        self.shm = shm
+        self.name = shm.name
+        self.owner = owner
+        self.interval = 1.0 / fps
+        self.slots = slots
+        self.max_width = max_width
+        self.max_height = max_height
+        header_count = self.HEADER_FIELDS + self.SLOT_FIELDS * slots
+        self.header = np.ndarray((header_count,), np.int64, buffer=shm.buf)
+        self.frames = np.ndarray((slots, max_height * max_width * 3), np.uint8, buffer=shm.buf,
+                                 offset=self.header_bytes(slots))
+        self._next_publish = 0.0
+
+    @classmethod
+    def header_bytes(cls, slots):
+        # Keep the frames cache line aligned
+        return -(-(cls.HEADER_FIELDS + cls.SLOT_FIELDS * slots) * 8 // 64) * 64
+
+    @classmethod
+    def create(cls, slots=PREVIEW_RING_SLOTS, max_width=PREVIEW_MAX_WIDTH, max_height=PREVIEW_MAX_HEIGHT):
+        """Allocates a new ring; the creating process unlinks it when done."""
+        size = cls.header_bytes(slots) + slots * max_width * max_height * 3
+        ring = cls(shared_memory.SharedMemory(create=True, size=size), True,
+                   slots=slots, max_width=max_width, max_height=max_height)
+        ring.header[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name, slots=PREVIEW_RING_SLOTS, max_width=PREVIEW_MAX_WIDTH, max_height=PREVIEW_MAX_HEIGHT):
+        """Opens a ring created by another process."""
+        try:
+            # The creator owns the segment; keep this process's resource tracker from removing it
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, False, slots=slots, max_width=max_width, max_height=max_height)
+
+    def set_size(self, width, height):
+        """Called by the GUI with the current size of the video label."""
+        if width > 1 and height > 1:
+            self.header[1] = min(width, self.max_width)
+            self.header[2] = min(height, self.max_height)
+
+    def is_due(self, now):
+        """True if a frame captured at `now` should be published."""
+        return self.header[1] > 0 and now >= self._next_publish
+
+    def _slot_header(self, slot):
+        start = self.HEADER_FIELDS + self.SLOT_FIELDS * slot
+        return self.header[start:start + self.SLOT_FIELDS]
+
+    def publish(self, frame, now):
+        """Scales and converts `frame` into the next slot and makes it the newest frame."""
+        self._next_publish = now + self.interval
+        width, height = int(self.header[1]), int(self.header[2])
+        seq = int(self.header[0]) + 1
+        slot = seq % self.slots
+        slot_header = self._slot_header(slot)
+        slot_header[0] = -1  # Being written
+        view = self.frames[slot][:height * width * 3].reshape(height, width, 3)
+        cv2.resize(frame, (width, height), dst=view, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(view, cv2.COLOR_BGR2RGB, dst=view)
+        slot_header[1], slot_header[2] = width, height
+        slot_header[0] = seq
+        self.header[0] = seq
+
+    def latest_image(self, seen_seq):
+        """Returns (seq, PIL image) if a frame newer than `seen_seq` was published, otherwise None."""
+        seq = int(self.header[0])
+        if seq == 0 or seq == seen_seq:
+            return None
+        slot_header = self._slot_header(seq % self.slots)
+        width, height = int(slot_header[1]), int(slot_header[2])
+        if slot_header[0] != seq:
+            return None
+        view = self.frames[seq % self.slots][:height * width * 3].reshape(height, width, 3)
+        img = Image.fromarray(view)  # Copies the pixels
+        if slot_header[0] != seq:
+            # The engine lapped the ring while we were reading
+            return None
+        return seq, img
+
+    def close(self):
+        # Views into the buffer must go before it can be closed
+        self.header = self.frames = None
+        self.shm.close()
+
+    def unlink(self):
+        """Closes the ring and, in the creating process, frees it."""
+        self.close()
+        if self.owner:
+            self.shm.unlink()
+
+preview = PreviewBuffer()  # Replaced by the frame source of each tracking run
+preview_seq = 0  # Last frame shown by the GUI
+preview_image = None  # PhotoImage shown in the video label
+engine_flags = []  # Shared flags the GUI changes while the engine runs
+preview_lock = threading.Lock()  # Held while the GUI reads `preview` and while it is swapped out
+
+# --- Face Tracking ---
+class InferenceScheduler:
+    """
+    Decides which frames face inference runs on. Runs at INFERENCE_MAX_FPS right
+    after the face state changes, at the target rate while it is stable, and
+    drops to INFERENCE_MIN_FPS once it has been stable for a long time.
+    """
+    def __init__(self, target_fps=INFERENCE_TARGET_FPS, max_fps=INFERENCE_MAX_FPS, min_fps=INFERENCE_MIN_FPS,
+                 boost_seconds=INFERENCE_BOOST_SECONDS, relax_seconds=INFERENCE_RELAX_SECONDS):
+        self.target_fps = target_fps
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.boost_seconds = boost_seconds
+        self.relax_seconds = relax_seconds
+        self.last_change = None
+        self.next_run = 0.0
+
+    def current_fps(self, now):
+        """Returns the inference rate for the time since the last state change."""
+        if self.last_change is None:
+            return self.max_fps
+        stable_for = now - self.last_change
+        if stable_for < self.boost_seconds:
+            return self.max_fps
+        if stable_for < self.relax_seconds:
+            return self.target_fps
+        return self.min_fps
+
+    def is_due(self, now):
+        """True if inference should run on a frame captured at `now`."""
+        return now >= self.next_run
+
+    def record(self, now, state_changed):
+        """Schedules the next inference after one has run."""
+        if state_changed or self.last_change is None:
+            self.last_change = now
+        self.next_run = now + 1.0 / self.current_fps(now)
+
+class FaceTracker:
+    """
+    Runs face inference on the frames the scheduler picks and keeps the last
+    result for the frames in between. With a face detector, a cheap low
+    resolution detection runs first and FaceMesh only runs when landmarks are
+    needed for drawing or the detector's nose position is too close to the
+    threshold to trust. FaceMesh runs on a crop around the last known face.
+    """
+    def __init__(self, face_mesh, scheduler, face_detector=None, roi_enabled=ROI_ENABLED):
+        self.face_mesh = face_mesh
+        self.scheduler = scheduler
+        self.face_detector = face_detector
+        self.roi_enabled = roi_enabled
+        self.roi = None  # (x0, y0, x1, y1) crop for the next FaceMesh run, None for the whole frame
+        self.face_detected = False
+        self.head_facing_forward = False
+        self.landmarks = None  # Landmarks of the last FaceMesh run, normalized to draw_box
+        self.draw_box = None
+        self.mesh_runs = 0
+        self.timings = None  # Stage timings, when set to a dict
+
+    def update(self, frame, now, need_landmarks=True):
+        """Runs inference on `frame` if it is due. Returns True if it ran."""
+        if not self.scheduler.is_due(now):
+            return False
+
+        previous_state = (self.face_detected, self.head_facing_forward)
+        image_height, image_width = frame.shape[:2]
+        full_frame = (0, 0, image_width, image_height)
+
+        detection = None
+        if self.face_detector is not None:
+            detection = self._detect(frame)
+            if detection is None:
+                self._set_no_face()
+                self.scheduler.record(now, (self.face_detected, self.head_facing_forward) != previous_state)
+                return True
+            box, nose_x = detection
+            ambiguous = abs(abs(nose_x - 0.5) - HEAD_FORWARD_THRESHOLD) < NOSE_AMBIGUITY
+            if not need_landmarks and not ambiguous:
+                self.face_detected = True
+                self.head_facing_forward = abs(nose_x - 0.5) < HEAD_FORWARD_THRESHOLD
+                self.landmarks = None
+                self.scheduler.record(now, (self.face_detected, self.head_facing_forward) != previous_state)
+                return True
+            # Crop FaceMesh to the face the detector found
+            self.roi = self._expand_box(box, image_width, image_height)
+
+        box = self.roi if self.roi_enabled and self.roi else full_frame
+        results = self._process(frame, box)
+        if not results.multi_face_landmarks and box != full_frame:
+            # The face left the crop; look at the whole frame again
+            box = full_frame
+            results = self._process(frame, box)
+
+        if results.multi_face_landmarks:
+            self.face_detected = True
+            self.landmarks = results.multi_face_landmarks[0]
+            self.draw_box = box
+            x0, y0, x1, y1 = box
+            # A simple check for head orientation: if the nose tip's x-coordinate is too far from the center
+            nose_tip = self.landmarks.landmark[1]  # Landmark for the nose tip
+            x_normalized = (x0 + nose_tip.x * (x1 - x0)) / image_width
+            self.head_facing_forward = abs(x_normalized - 0.5) < HEAD_FORWARD_THRESHOLD
+            self.roi = self._face_roi(self.landmarks, box, image_width, image_height)
+        elif detection is not None:
+            # The detector saw a face that FaceMesh could not fit; trust the detector
+            self.face_detected = True
+            self.head_facing_forward = abs(detection[1] - 0.5) < HEAD_FORWARD_THRESHOLD
+            self.landmarks = None
+            self.roi = None
+        else:
+            self._set_no_face()
+
+        self.scheduler.record(now, (self.face_detected, self.head_facing_forward) != previous_state)
+        return True
+
+    def _set_no_face(self):
+        self.face_detected = False
+        self.head_facing_forward = False
+        self.landmarks = None
+        self.roi = None
+
+    def _detect(self, frame):
+        """
+        Runs the face detector on a downscaled copy of `frame`. Returns the face
+        box in pixels and the nose tip's normalized x, or None if there is no face.
+        """
+        image_height, image_width = frame.shape[:2]
+        scale = min(1.0, DETECTION_WIDTH / image_width)
+        with timed(self.timings, 'convert'):
+            small = cv2.resize(frame, (int(image_width * scale), int(image_height * scale)), interpolation=cv2.INTER_AREA)
+            rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        with timed(self.timings, 'face_detection'):
+            results = self.face_detector.process(rgb_small)
+        if not results.detections:
+            return None
+        detection = max(results.detections, key=lambda d: d.score[0])
+        location = detection.location_data
+        bounding_box = location.relative_bounding_box
+        nose_tip = location.relative_keypoints[mp.solutions.face_detection.FaceKeyPoint.NOSE_TIP]
+        box = (bounding_box.xmin * image_width, bounding_box.ymin * image_height,
+               (bounding_box.xmin + bounding_box.width) * image_width,
+               (bounding_box.ymin + bounding_box.height) * image_height)
+        return box, nose_tip.x
+
+    def _process(self, frame, box):
+        x0, y0, x1, y1 = box
+        with timed(self.timings, 'convert'):
+            rgb_crop = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+        self.mesh_runs += 1
+        with timed(self.timings, 'face_mesh'):
+            return self.face_mesh.process(rgb_crop)
+
+    @staticmethod
+    def _expand_box(box, image_width, image_height):
+        """Returns `box` grown by ROI_MARGIN and clipped to the frame, or None if it is most of the frame."""
+        x0, y0, x1, y1 = box
+        margin_x = (x1 - x0) * ROI_MARGIN
+        margin_y = (y1 - y0) * ROI_MARGIN
+        roi = (max(0, int(x0 - margin_x)), max(0, int(y0 - margin_y)),
+               min(image_width, int(x1 + margin_x)), min(image_height, int(y1 + margin_y)))
+        area = (roi[2] - roi[0]) * (roi[3] - roi[1])
+        if roi[2] <= roi[0] or roi[3] <= roi[1] or area > 0.8 * image_width * image_height:
+            return None
+        return roi
+
+    @classmethod
+    def _face_roi(cls, landmarks, box, image_width, image_height):
+        """Returns a crop around the landmarks with ROI_MARGIN to spare."""
+        x0, y0, x1, y1 = box
+        xs = [x0 + point.x * (x1 - x0) for point in landmarks.landmark]
+        ys = [y0 + point.y * (y1 - y0) for point in landmarks.landmark]
+        return cls._expand_box((min(xs), min(ys), max(xs), max(ys)), image_width, image_height)
+
+    def draw(self, frame, color):
+        """Draws the last landmarks on `frame` in `color`."""
+        if self.landmarks is None:
+            return
+        x0, y0, x1, y1 = self.draw_box
+        mp_drawing = mp.solutions.drawing_utils
+        # Landmarks are normalized to the crop they came from, so draw on that part of the frame
+        mp_drawing.draw_landmarks(
+            image=frame[y0:y1, x0:x1],
+            landmark_list=self.landmarks,
+            connections=mp.solutions.face_mesh.FACEMESH_TESSELATION,
+            landmark_drawing_spec=mp_drawing.DrawingSpec(color=color, thickness=1, circle_radius=1))
+
+# --- Focus History ---
+class SeriesRing:
+    """A fixed-size ring of (time, focused, distracted) samples in preallocated arrays."""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.focused = array('d', bytes(8 * capacity))
+        self.distracted = array('d', bytes(8 * capacity))
+        self.start = 0
+        self.count = 0
+        self.wrapped = False  # True once old samples have been overwritten
+
+    def append(self, t, focused, distracted):
+        index = (self.start + self.count) % self.capacity
+        if self.count == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+            self.wrapped = True
+        else:
+            self.count += 1
+        self.times[index] = t
+        self.focused[index] = focused
+        self.distracted[index] = distracted
+
+    def replace_last(self, t, focused, distracted):
+        index = (self.start + self.count - 1) % self.capacity
+        self.times[index] = t
+        self.focused[index] = focused
+        self.distracted[index] = distracted
+
+    def columns(self):
+        """Returns the samples oldest first as (times, focused, distracted) lists."""
+        end = self.start + self.count
+        if end <= self.capacity:
+            return tuple(column[self.start:end].tolist() for column in (self.times, self.focused, self.distracted))
+        end -= self.capacity
+        return tuple(column[self.start:].tolist() + column[:end].tolist()
+                     for column in (self.times, self.focused, self.distracted))
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+        self.wrapped = False
+
+class TimeSeriesStore:
+    """
+    Cumulative focused and distracted time over a session, kept at several
+    resolutions in fixed-size rings so memory stays bounded however long the
+    session runs. Each resolution keeps the last sample of each interval,
+    which is exact for cumulative values.
+    """
+    def __init__(self, resolutions=SERIES_RESOLUTIONS):
+        self.resolutions = [(step, SeriesRing(capacity)) for step, capacity in resolutions]
+        self.last_buckets = [None] * len(self.resolutions)
+
+    def __len__(self):
+        return self.resolutions[0][1].count
+
+    def append(self, t, focused, distracted):
+        """Records the totals at session time `t`; samples in the same interval replace each other."""
+        for i, (step, ring) in enumerate(self.resolutions):
+            bucket = int(t // step)
+            if bucket == self.last_buckets[i]:
+                ring.replace_last(t, focused, distracted)
+            else:
+                ring.append(t, focused, distracted)
+                self.last_buckets[i] = bucket
+
+    def clear(self):
+        for _, ring in self.resolutions:
+            ring.clear()
+        self.last_buckets = [None] * len(self.resolutions)
+
+    def series(self, max_points=GRAPH_MAX_POINTS):
+        """
+        Returns (focus_x, focus_y, distraction_x, distraction_y) for the whole
+        session, from the finest resolution that still holds all of it,
+        downsampled to at most `max_points` per line.
+        """
+        ring = self.resolutions[-1][1]
+        for _, candidate in self.resolutions:
+            if not candidate.wrapped:
+                ring = candidate
+                break
+        times, focused, distracted = ring.columns()
+        focus_x, focus_y = downsample_lttb(times, focused, max_points)
+        distraction_x, distraction_y = downsample_lttb(times, distracted, max_points)
+        return focus_x, focus_y, distraction_x, distraction_y
+
+def downsample_lttb(xs, ys, threshold):
+    """
+    Reduces a series to `threshold` points with Largest-Triangle-Three-Buckets,
+    which keeps the points that shape the line.
+    """
+    length = len(xs)
+    if threshold >= length or threshold < 3:
+        return xs, ys
+
+    sampled_x = [xs[0]]
+    sampled_y = [ys[0]]
+    bucket_size = (length - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third corner of the triangle
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, length)
+        next_count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / next_count
+        avg_y = sum(ys[next_start:next_end]) / next_count
+
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = xs[a], ys[a]
+        best_area = -1.0
+        best = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        sampled_x.append(xs[best])
+        sampled_y.append(ys[best])
+        a = best
+
+    sampled_x.append(xs[-1])
+    sampled_y.append(ys[-1])
+    return sampled_x, sampled_y
+
+focus_series = TimeSeriesStore()
+
+# --- Session History ---
+EVENT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    ended REAL
+);
+CREATE TABLE IF NOT EXISTS intervals (
+    session_id INTEGER NOT NULL,
+    started REAL NOT NULL,
+    ended REAL NOT NULL,
+    hour REAL NOT NULL,
+    focused INTEGER NOT NULL,
+    app TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS intervals_started ON intervals (started);
+CREATE INDEX IF NOT EXISTS intervals_app_started ON intervals (app, started);
+"""
+
+def hour_start(t):
+    """Returns the start of the local hour containing `t`."""
+    return datetime.datetime.fromtimestamp(t).replace(minute=0, second=0, microsecond=0).timestamp()
+
+class EventLog:
+    """
+    Append-only log of focus state intervals in a SQLite database. The tracking
+    loop records state changes; each finished interval is queued and a writer
+    thread commits them in batches, so the loop never waits on the disk.
+    Intervals are split at hour boundaries so reports can group by hour.
+    """
+    def __init__(self, path=EVENT_DB_FILE, flush_interval=EVENT_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.session_id = None
+        self.current = None  # (started, focused, app) of the interval in progress
+        self._pending = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=5.0)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _ensure_writer(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write_loop, daemon=True)
+                self._thread.start()
+
+    def _write_loop(self):
+        connection = self.connect()
+        connection.executescript(EVENT_SCHEMA)
+        while True:
+            batch = [self._pending.get()]
+            # Collect whatever else arrives within the flush interval into one transaction
+            deadline = time.time() + self.flush_interval
+            while time.time() < deadline:
+                try:
+                    batch.append(self._pending.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            try:
+                with connection:
+                    for statement, params in batch:
+                        connection.execute(statement, params)
+            except sqlite3.Error as e:
+                print(f"Could not write session history: {e}")
+            for _ in batch:
+                self._pending.task_done()
+
+    def flush(self):
+        """Waits until everything recorded so far is in the database."""
+        if self._thread is not None:
+            self._pending.join()
+
+    def start_session(self, now):
+        self._ensure_writer()
+        self.session_id = int(now * 1000)
+        self.current = None
+        self._pending.put(("INSERT INTO sessions (id, started) VALUES (?, ?)", (self.session_id, now)))
+
+    def record(self, now, focused, app):
+        """Notes the focus state at `now`; only changes of state are written."""
+        if self.session_id is None:
+            return
+        if self.current is None:
+            self.current = (now, focused, app)
+            return
+        started, current_focused, current_app = self.current
+        # Close the interval at each hour boundary it crossed
+        boundary = hour_start(started) + 3600
+        while now >= boundary:
+            self._write_interval(started, boundary, current_focused, current_app)
+            started = boundary
+            boundary += 3600
+        if (focused, app) != (current_focused, current_app):
+            self._write_interval(started, now, current_focused, current_app)
+            started = now
+        self.current = (started, focused, app)
+
+    def end_session(self, now):
+        if self.session_id is None:
+            return
+        if self.current is not None:
+            self.record(now, None, None)
+        self._pending.put(("UPDATE sessions SET ended = ? WHERE id = ?", (now, self.session_id)))
+        self.session_id = None
+        self.current = None
+
+    def _write_interval(self, started, ended, focused, app):
+        if ended > started:
+            self._pending.put((
+                "INSERT INTO intervals (session_id, started, ended, hour, focused, app) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.session_id, started, ended, hour_start(started), int(focused), app)))
+
+    def has_data(self):
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with closing(self.connect()) as connection:
+                return connection.execute("SELECT 1 FROM intervals LIMIT 1").fetchone() is not None
+        except sqlite3.Error:
+            return False
+
+    def distraction_per_app(self, since, until):
+        """Returns [(app, seconds)] distracted between `since` and `until`, most first."""
+        with closing(self.connect()) as connection:
+            return connection.execute("""
+                SELECT app, SUM(MIN(ended, :until) - MAX(started, :since)) AS seconds
+                FROM intervals
+                WHERE started < :until AND started >= :since - 3600 AND ended > :since AND focused = 0
+                GROUP BY app ORDER BY seconds DESC
+            """, {'since': since, 'until': until}).fetchall()
+
+    def focus_by_hour(self, since, until):
+        """Returns [(hour start, focused seconds, total seconds)] between `since` and `until`."""
+        with closing(self.connect()) as connection:
+            return connection.execute("""
+                SELECT hour, SUM(CASE WHEN focused THEN ended - started ELSE 0 END), SUM(ended - started)
+                FROM intervals
+                WHERE started >= :since AND started < :until
+                GROUP BY hour ORDER BY hour
+            """, {'since': since, 'until': until}).fetchall()
+
+    def longest_streaks(self, since, until, limit=5):
+        """
+        Returns [(start, end, seconds)] of the longest unbroken focused stretches
+        between `since` and `until`, longest first.
+        """
+        with closing(self.connect()) as connection:
+            return connection.execute("""
+                WITH marked AS (
+                    SELECT started, ended, focused,
+                           CASE WHEN focused = LAG(focused) OVER w AND started - LAG(ended) OVER w < 1.0
+                                THEN 0 ELSE 1 END AS new_run
+                    FROM intervals
+                    WHERE started >= :since AND started < :until
+                    WINDOW w AS (ORDER BY started)
+                ), runs AS (
+                    SELECT started, ended, focused, SUM(new_run) OVER (ORDER BY started) AS run
+                    FROM marked
+                )
+                SELECT MIN(started), MAX(ended), MAX(ended) - MIN(started) AS seconds
+                FROM runs WHERE focused = 1
+                GROUP BY run ORDER BY seconds DESC LIMIT :limit
+            """, {'since': since, 'until': until, 'limit': limit}).fetchall()
+
+event_log = EventLog()
 
 # --- Pomodoro Timer Functions ---
-def pomodoro_timer_loop():
-    """Handles the countdown for the Pomodoro timer, pausing on distraction."""
-    global pomodoro_minutes, pomodoro_seconds, pomodoro_running, pomodoro_paused, focus_session_count, tracking_active, face_detected_in_frame, head_facing_forward, target_app_titles
-    
-    while pomodoro_running:
-        # Check for distraction and pause the timer
-        current_active_window = get_active_window_title()
-        is_focused_on_app = current_active_window.strip().lower() in [t.strip().lower() for t in target_app_titles]
-        is_focused = tracking_active and head_facing_forward and face_detected_in_frame and is_focused_on_app
-        
-        if not is_focused:
-            pomodoro_paused = True
-            pomodoro_label.config(text=f"Timer Paused: {pomodoro_minutes:02d}:{pomodoro_seconds:02d}")
-            time.sleep(1) # Sleep to prevent busy-waiting
-            continue
-        
-        pomodoro_paused = False
-        pomodoro_label.config(text=f"Time Left: {pomodoro_minutes:02d}:{pomodoro_seconds:02d}")
-
-        if pomodoro_minutes == 0 and pomodoro_seconds == 0:
-            pomodoro_running = False
-            focus_session_count += 1
-            gamification_label.config(text=f"🎉 You completed a focus session! Total sessions: {focus_session_count} 🎉")
-            messagebox.showinfo("Pomodoro", "Time to take a break! 🥳")
-            reset_pomodoro()
+class PomodoroTimer:
+    """
+    Pomodoro countdown run by Tk's `after` on the GUI thread. Time left comes
+    from a monotonic deadline, so late callbacks never make the timer drift,
+    and the countdown holds while the user is not focused. States: 'idle',
+    'running' and 'paused' (by the user).
+    """
+    def __init__(self, duration=POMODORO_SECONDS):
+        self.duration = duration
+        self.state = 'idle'
+        self.remaining = float(duration)
+        self.deadline = None  # Monotonic time the countdown ends, while it is counting
+        self.after_id = None
+
+    def start(self):
+        if self.state == 'idle':
+            self.state = 'running'
+            self._tick()
+
+    def pause(self):
+        if self.state == 'running':
+            self._hold(time.monotonic())
+            self._cancel()
+            self.state = 'paused'
+            self._show("Timer Paused")
+
+    def resume(self):
+        if self.state == 'paused':
+            self.state = 'running'
+            self._tick()
+
+    def reset(self):
+        self._cancel()
+        self.state = 'idle'
+        self.remaining = float(self.duration)
+        self.deadline = None
+        self._show("Time Left")
+
+    def _hold(self, now):
+        """Stops counting and keeps the time left."""
+        if self.deadline is not None:
+            self.remaining = max(0.0, self.deadline - now)
+            self.deadline = None
+
+    def _cancel(self):
+        if self.after_id is not None:
+            root.after_cancel(self.after_id)
+            self.after_id = None
+
+    def _show(self, prefix):
+        minutes, seconds = divmod(math.ceil(self.remaining), 60)
+        pomodoro_label.config(text=f"{prefix}: {minutes:02d}:{seconds:02d}")
+
+    def _tick(self):
+        self.after_id = None
+        now = time.monotonic()
+        # Count down only while the tracker says the user is focused
+        if tracking_state.snapshot.focused:
+            if self.deadline is None:
+                self.deadline = now + self.remaining
+            self.remaining = max(0.0, self.deadline - now)
+        else:
+            self._hold(now)
+
+        if self.remaining <= 0:
+            self.state = 'idle'
+            complete_pomodoro()
             return
 
-        time.sleep(1)
-        if pomodoro_seconds > 0:
-            pomodoro_seconds -= 1
+        if self.deadline is None:
+            self._show("Timer Paused")
+            delay = POMODORO_HOLD_CHECK_INTERVAL
         else:
-            pomodoro_seconds = 59
-            pomodoro_minutes -= 1
+            self._show("Time Left")
+            # Wake up when the displayed second changes
+            delay = self.remaining - math.floor(self.remaining) or 1.0
+        self.after_id = root.after(max(10, int(delay * 1000)), self._tick)
+
+pomodoro = PomodoroTimer()
+
+def complete_pomodoro():
+    """Counts a finished focus session."""
+    global focus_session_count
+    focus_session_count += 1
+    gamification_label.config(text=f"🎉 You completed a focus session! Total sessions: {focus_session_count} 🎉")
+    messagebox.showinfo("Pomodoro", "Time to take a break! 🥳")
+    reset_pomodoro()
 
 def start_pomodoro():
     """Starts the Pomodoro timer."""
-    global pomodoro_running, pomodoro_thread, pomodoro_paused
-    if not pomodoro_running:
-        pomodoro_running = True
-        pomodoro_paused = False
-        pomodoro_thread = threading.Thread(target=pomodoro_timer_loop, daemon=True)
-        pomodoro_thread.start()
+    if pomodoro.state == 'idle':
+        pomodoro.start()
         pomodoro_start_button.config(state=tk.DISABLED)
         pomodoro_pause_button.config(state=tk.NORMAL)
         pomodoro_stop_button.config(state=tk.NORMAL)
 
 def pause_pomodoro():
     """Pauses or resumes the Pomodoro timer."""
-    global pomodoro_paused
-    pomodoro_paused = not pomodoro_paused
-    if pomodoro_paused:
+    if pomodoro.state == 'running':
+        pomodoro.pause()
         pomodoro_pause_button.config(text="Resume")
-    else:
+    elif pomodoro.state == 'paused':
+        pomodoro.resume()
         pomodoro_pause_button.config(text="Pause")
-        # Restart the loop to continue the timer
-        threading.Thread(target=pomodoro_timer_loop, daemon=True).start()
 
 def reset_pomodoro():
     """Stops and resets the Pomodoro timer."""
-    global pomodoro_running, pomodoro_minutes, pomodoro_seconds, pomodoro_paused
-    pomodoro_running = False
-    pomodoro_paused = False
-    pomodoro_minutes = 25
-    pomodoro_seconds = 0
-    pomodoro_label.config(text=f"Time Left: {pomodoro_minutes:02d}:{pomodoro_seconds:02d}")
+    pomodoro.reset()
     pomodoro_start_button.config(state=tk.NORMAL)
     pomodoro_pause_button.config(state=tk.DISABLED, text="Pause")
     pomodoro_stop_button.config(state=tk.DISABLED)
 
 # --- Core Logic Functions ---
-def webcam_loop():
-    """Background thread for webcam and face tracking."""
-    global focused_time, distracted_time, tracking_active, face_detected_in_frame, head_facing_forward, cap, frame_buffer, focus_data, distraction_data, last_frame, start_time, distraction_per_app, target_app_titles
-    
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print("Error: Could not open webcam.")
-        stop_event.set()
+def tracking_engine(stop, publish_state, frame_sink, show_landmarks_flag, focused_flag,
+                    grabber=None, clock=time.time, timings=None):
+    """
+    Captures frames, detects the face and publishes preview frames until `stop`
+    is set. Runs on a thread or in a worker process; face state goes back
+    through `publish_state` and preview frames through `frame_sink`. The
+    replay harness passes its own frame source, clock and timings dict;
+    otherwise stage telemetry is summarized and published every
+    TELEMETRY_INTERVAL.
+    """
+    if grabber is None:
+        grabber = FrameGrabber()
+    if timings is None:
+        timings = StageTelemetry()
+    telemetry = timings if isinstance(timings, StageTelemetry) else None
+    next_telemetry = time.monotonic() + TELEMETRY_INTERVAL
+    if not grabber.open():
+        publish_state(('error', "Could not open webcam."))
         return
 
     mp_face_mesh = mp.solutions.face_mesh
@@ -184,125 +1396,221 @@ def webcam_loop():
         max_num_faces=1,
         refine_landmarks=True,
         min_detection_confidence=0.5,
-        min_tracking_confidence=0.5) as face_mesh:
+        min_tracking_confidence=0.5) as face_mesh, \
+        mp.solutions.face_detection.FaceDetection(
+        model_selection=0,
+        min_detection_confidence=0.5) as face_detector:
         
-        last_check = time.time()
-        start_time = time.time()
+        tracker = FaceTracker(face_mesh, InferenceScheduler(), face_detector if CASCADE_ENABLED else None,
+                              roi_enabled=ROI_ENABLED)
+        tracker.timings = timings
         
-        while not stop_event.is_set():
-            ret, frame = cap.read()
-            if not ret:
+        while not stop.is_set():
+            with timed(timings, 'read'):
+                frame, captured_at = grabber.read()
+            if frame is None:
                 continue
 
-            # Process the frame for face detection
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = face_mesh.process(rgb_frame)
-            
-            with lock:
-                face_detected_in_frame = bool(results.multi_face_landmarks)
-                
-            if face_detected_in_frame:
-                face_landmarks = results.multi_face_landmarks[0]
-                # A simple check for head orientation: if the nose tip's x-coordinate is too far from the center
-                image_width, image_height = frame.shape[1], frame.shape[0]
-                nose_tip = face_landmarks.landmark[1] # Landmark for the nose tip
-                x_normalized = nose_tip.x
-                center_x = 0.5
-                # Define a threshold for "forward-facing"
-                if abs(x_normalized - center_x) < 0.15: # 0.15 is a simple threshold
-                    head_facing_forward = True
-                else:
-                    head_facing_forward = False
-            else:
-                head_facing_forward = False
-            
-            now = time.time()
-            current_active_window = get_active_window_title()
-
-            with lock:
-                is_focused_on_app = current_active_window.strip().lower() in [t.strip().lower() for t in target_app_titles]
-                is_focused = tracking_active and face_detected_in_frame and head_facing_forward and is_focused_on_app
-                
-                delta_time = now - last_check
-                if is_focused:
-                    focused_time += delta_time
-                else:
-                    distracted_time += delta_time
-                    # --- FIX: Use the normalized app name for the dictionary key ---
-                    normalized_app_name = get_normalized_app_name(current_active_window)
-                    if normalized_app_name:
-                        distraction_per_app[normalized_app_name] += delta_time
-                    else:
-                        distraction_per_app["(No Active Window)"] += delta_time
-                last_check = now
-                
-                # Update data for the graph every second
-                if int(now - start_time) > len(focus_data) + 1:
-                    focus_data.append((now - start_time, focused_time))
-                    distraction_data.append((now - start_time, distracted_time))
+            # Run face detection on the frames the scheduler picks; the others reuse its result
+            inferred = tracker.update(frame, captured_at, need_landmarks=show_landmarks_flag.value)
+            if inferred:
+                publish_state(('face', tracker.face_detected, tracker.head_facing_forward, captured_at))
             
-            # Draw landmarks on the frame
-            if face_detected_in_frame:
-                mp_drawing = mp.solutions.drawing_utils
-                for face_landmarks in results.multi_face_landmarks:
+            # Draw and publish a frame for the live view only as often as it is shown
+            now = clock()
+            published = frame_sink.is_due(now)
+            if published:
+                if tracker.face_detected and show_landmarks_flag.value:
                     # Draw landmarks with a different color if distracted
-                    drawing_spec_color = (0, 255, 0) if is_focused else (0, 0, 255)
-                    mp_drawing.draw_landmarks(
-                        image=frame,
-                        landmark_list=face_landmarks,
-                        connections=mp_face_mesh.FACEMESH_TESSELATION,
-                        landmark_drawing_spec=mp_drawing.DrawingSpec(color=drawing_spec_color, thickness=1, circle_radius=1))
-            
-            # Store the frame in a buffer for the GUI to display
-            with lock:
-                last_frame = frame.copy()
+                    with timed(timings, 'draw'):
+                        tracker.draw(frame, (0, 255, 0) if focused_flag.value else (0, 0, 255))
+                with timed(timings, 'preview'):
+                    frame_sink.publish(frame, now)
+
+            if telemetry is not None:
+                telemetry.count('frames')
+                telemetry.count('inferences', inferred)
+                telemetry.count('previews', published)
+                if time.monotonic() >= next_telemetry:
+                    next_telemetry = time.monotonic() + TELEMETRY_INTERVAL
+                    summary = telemetry.summary()
+                    summary['capture'] = grabber.stats()
+                    publish_state(('telemetry', summary))
+
+    grabber.release()
+    publish_state(('stopped', grabber.stats()))
+
+def run_engine_process(ring_name, states, stop, show_landmarks_flag, focused_flag):
+    """Entry point of the tracking engine's worker process."""
+    ring = SharedFrameRing.attach(ring_name)
+    try:
+        tracking_engine(stop, states.put, ring, show_landmarks_flag, focused_flag)
+    finally:
+        ring.close()
+
+def export_telemetry(report):
+    """Appends a telemetry report to the rotating JSON lines file."""
+    line = {'host': platform.node(), 'platform': platform.platform(), 'engine_process': ENGINE_PROCESS, **report}
+    try:
+        telemetry_logger().info(json.dumps(line, default=str))
+    except (OSError, ValueError) as e:
+        print(f"Could not write telemetry: {e}")
 
-    cap.release()
-    print("Webcam loop stopped.")
+def webcam_loop():
+    """
+    Background thread for face tracking. Starts the tracking engine, in a
+    worker process if ENGINE_PROCESS is set, and turns the face state it
+    reports into focused and distracted time.
+    """
+    global start_time, preview, preview_seq, telemetry_report
+    
+    context = multiprocessing.get_context('spawn')
+    show_landmarks_flag = context.RawValue('b', show_landmarks)
+    focused_flag = context.RawValue('b', False)
+    engine_flags[:] = [show_landmarks_flag]
+    if ENGINE_PROCESS:
+        states = context.Queue()
+        engine_stop = context.Event()
+        ring = SharedFrameRing.create()
+        engine = context.Process(target=run_engine_process, daemon=True,
+                                 args=(ring.name, states, engine_stop, show_landmarks_flag, focused_flag))
+        frame_source = ring
+    else:
+        states = queue.Queue()
+        engine_stop = threading.Event()
+        ring = None
+        frame_source = PreviewBuffer()
+        engine = threading.Thread(target=tracking_engine, daemon=True,
+                                  args=(engine_stop, states.put, frame_source, show_landmarks_flag, focused_flag))
+    with preview_lock:
+        preview = frame_source
+        preview_seq = 0
+    engine.start()
+
+    start_time = time.time()
+    with lock:
+        focus_series.clear()
+    tracking_state.reset(start_time, tracking_active=True)
+    event_log.start_session(start_time)
+    next_export = time.time()
+    
+    while not stop_event.is_set():
+        try:
+            message = states.get(timeout=0.1)
+        except queue.Empty:
+            message = None
+            if not engine.is_alive():
+                print("Error: The tracking engine stopped unexpectedly.")
+                stop_event.set()
+                break
+        
+        now = time.time()
+        face_state = message[1:3] if message is not None and message[0] == 'face' else None
+        app_name, is_focused = account_focus(now, face_state, window_provider.snapshot.title)
+        snapshot = tracking_state.snapshot
+        with lock:
+            # Update data for the graph; samples within the same second replace each other
+            focus_series.append(now - start_time, snapshot.focused_time, snapshot.distracted_time)
+        focused_flag.value = is_focused
+        event_log.record(now, is_focused, app_name or "(No Active Window)")
+
+        if message is None:
+            continue
+        if message[0] == 'error':
+            print(f"Error: {message[1]}")
+            stop_event.set()
+        elif message[0] == 'telemetry':
+            telemetry_report = {'time': now, 'engine': message[1], 'gui': gui_telemetry.summary(),
+                                'window_events': window_provider.uses_events}
+            if TELEMETRY_EXPORT_INTERVAL and now >= next_export:
+                next_export = now + TELEMETRY_EXPORT_INTERVAL
+                export_telemetry(telemetry_report)
+
+    tracking_state.publish(tracking_active=False, focused=False)
+    event_log.end_session(time.time())
+    engine_stop.set()
+    stats = None
+    # Drain the queue so the engine can exit, and pick up its final counters
+    deadline = time.time() + 2.0
+    while time.time() < deadline:
+        try:
+            message = states.get(timeout=0.1)
+        except queue.Empty:
+            if not engine.is_alive():
+                break
+            continue
+        if message[0] == 'stopped':
+            stats = message[1]
+            break
+    engine.join(timeout=1.0)
+    with preview_lock:
+        preview = PreviewBuffer()
+        if ring is not None:
+            ring.unlink()
+    if stats:
+        print(f"Webcam loop stopped. Captured {stats['captured']} frames at {stats['capture_fps']:.1f} fps, "
+              f"dropped {stats['dropped']}, mean frame age {stats['mean_frame_age'] * 1000:.0f} ms.")
+    else:
+        print("Webcam loop stopped.")
 
 def update_gui():
     """Updates the GUI with new data from the webcam thread."""
-    global focused_time, distracted_time, tracking_active, face_detected_in_frame, head_facing_forward, last_frame
+    global preview_seq, preview_image, shown_telemetry
+    refresh_start = time.perf_counter()
     
-    if last_frame is not None:
-        frame = cv2.cvtColor(last_frame, cv2.COLOR_BGR2RGBA)
-        img = Image.fromarray(frame)
-        
-        # Resize the image to fit the label
-        width = video_label.winfo_width()
-        height = video_label.winfo_height()
-        if width > 0 and height > 0:
-            img = img.resize((width, height))
-        
-        img_tk = ImageTk.PhotoImage(image=img)
-        video_label.config(image=img_tk)
-        video_label.image = img_tk
+    # The tracking engine scales frames to the label's size
+    width, height = video_label.winfo_width(), video_label.winfo_height()
+    with preview_lock:
+        preview.set_size(width, height)
+        latest = preview.latest_image(preview_seq)
+    if latest is not None:
+        preview_seq, img = latest
+        # Reuse the PhotoImage while the size stays the same
+        if preview_image is not None and (preview_image.width(), preview_image.height()) == img.size:
+            preview_image.paste(img)
+        else:
+            preview_image = ImageTk.PhotoImage(image=img)
+            video_label.config(image=preview_image)
+        gui_telemetry.count('frames_shown')
     
     # Update stats labels
-    focused_label.config(text=f"Focused Time: {int(focused_time)}s")
-    distraction_label.config(text=f"Distraction Time: {int(distracted_time)}s")
+    state = tracking_state.snapshot
+    focused_label.config(text=f"Focused Time: {int(state.focused_time)}s")
+    distraction_label.config(text=f"Distraction Time: {int(state.distracted_time)}s")
     
     # Update status message based on new granular tracking
-    current_active_window = get_active_window_title()
-    if tracking_active:
-        if not face_detected_in_frame:
+    active_window_title = window_provider.snapshot.title
+    _, is_focused_on_app = title_classifier.classify(active_window_title)
+    if state.tracking_active:
+        if not state.face_detected:
             status_message = "Status: User is not detected. The PC is idle."
-        elif not head_facing_forward:
+        elif not state.head_facing_forward:
             status_message = "Status: Distracted (looking away)"
-        elif current_active_window.strip().lower() not in [t.strip().lower() for t in target_app_titles]:
-            status_message = f"Status: Distracted (on '{current_active_window}')"
+        elif not is_focused_on_app:
+            status_message = f"Status: Distracted (on '{active_window_title}')"
         else:
             status_message = f"Status: Focusing on selected applications"
     else:
         status_message = "Status: Idle"
     status_label.config(text=status_message)
 
+    # Refresh the performance panel when a new report came in
+    report = telemetry_report
+    if show_telemetry and report is not None and report is not shown_telemetry:
+        telemetry_label.config(text=format_telemetry(report))
+        shown_telemetry = report
+
+    gui_telemetry.observe('gui_refresh', time.perf_counter() - refresh_start)
     # Schedule the next update
-    root.after(10, update_gui)
+    root.after(int(1000 / PREVIEW_FPS), update_gui)
 
 def start_tracking_button_handler():
     """Starts the tracking process."""
-    global focused_time, distracted_time, target_app_titles, tracking_active, stop_event, focus_data, distraction_data, start_time, distraction_per_app
+    global target_app_titles, title_classifier, webcam_thread
+
+    if webcam_thread is not None and webcam_thread.is_alive():
+        # The last session is still shutting down; it would overwrite this one's state and preview
+        return
     
     selected_indices = app_listbox.curselection()
     if not selected_indices:
@@ -311,16 +1619,10 @@ def start_tracking_button_handler():
 
     # Get all selected application titles
     target_app_titles = [app_listbox.get(i) for i in selected_indices]
+    title_classifier = title_classifier.with_targets(target_app_titles)
     
-    with lock:
-        focused_time = 0
-        distracted_time = 0
-        focus_data.clear()
-        distraction_data.clear()
-        distraction_per_app.clear() # Clear the distraction report data
-        start_time = time.time()
-        tracking_active = True
-        stop_event.clear()
+    # The webcam thread clears the counters, the graph and the distraction report data when it starts
+    stop_event.clear()
         
     start_button.config(state=tk.DISABLED)
     stop_button.config(state=tk.NORMAL)
@@ -330,20 +1632,23 @@ def start_tracking_button_handler():
     gamification_label.config(text="Tracking started. Get ready to focus!")
 
     # Start the webcam thread
-    threading.Thread(target=webcam_loop, daemon=True).start()
+    webcam_thread = threading.Thread(target=webcam_loop, daemon=True)
+    webcam_thread.start()
 
 def stop_tracking_button_handler():
     """Stops the tracking process."""
-    global tracking_active, stop_event
-    with lock:
-        tracking_active = False
-        stop_event.set()
+    stop_event.set()
+    stop_button.config(state=tk.DISABLED)
     
     # Give a moment for the thread to stop
     root.after(500, finalize_stop)
 
 def finalize_stop():
     """Finalizes the GUI after the tracking thread has stopped."""
+    if webcam_thread is not None and webcam_thread.is_alive():
+        # Draining the engine can take a few seconds; Start stays off until it is done
+        root.after(100, finalize_stop)
+        return
     start_button.config(state=tk.NORMAL)
     stop_button.config(state=tk.DISABLED)
     show_graph_button.config(state=tk.NORMAL)
@@ -353,17 +1658,15 @@ def finalize_stop():
 
 def show_graph():
     """Displays a graph of focus vs. distraction time."""
-    if len(focus_data) < 2 or len(distraction_data) < 2:
+    if len(focus_series) < 2:
         messagebox.showinfo("No Data", "Not enough tracking data to plot a line graph.")
         return
     
     fig, ax = plt.subplots(figsize=(8, 6))
     
-    # Unpack the data for plotting
-    focus_x = [d[0] for d in focus_data]
-    focus_y = [d[1] for d in focus_data]
-    distraction_x = [d[0] for d in distraction_data]
-    distraction_y = [d[1] for d in distraction_data]
+    # Take the data at a resolution that fits the session length
+    with lock:
+        focus_x, focus_y, distraction_x, distraction_y = focus_series.series()
 
     ax.plot(focus_x, focus_y, label='Focused Time', color='#4CAF50')
     ax.plot(distraction_x, distraction_y, label='Distraction Time', color='#FF5733')
@@ -382,10 +1685,71 @@ def show_graph():
     canvas.draw()
     canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
+def format_duration(seconds):
+    """Formats seconds as e.g. 1h 05m or 12m 30s."""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m {seconds % 60:02d}s"
+
+def write_distraction_report(report_text, range_name):
+    """Fills the report with the current session, or with the saved history for a longer range."""
+    report_text.config(state='normal') # Enable editing to insert text
+    report_text.delete('1.0', tk.END)
+
+    days = REPORT_RANGES[range_name]
+    if days is None:
+        report_text.insert(tk.END, "Apps are ranked by the total time spent distracted on them.\n\n")
+        # Sort the dictionary by distraction time in descending order
+        sorted_distractions = sorted(tracking_state.snapshot.distraction_per_app.items(), key=lambda item: item[1], reverse=True)
+        for app_title, time_spent in sorted_distractions:
+            report_text.insert(tk.END, f"  - {app_title}: {time_spent:.2f} seconds\n")
+        report_text.config(state='disabled') # Disable editing again
+        return
+
+    until = time.time()
+    midnight = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    since = (midnight - datetime.timedelta(days=days)).timestamp()
+    try:
+        event_log.flush()
+        distractions = event_log.distraction_per_app(since, until)
+        hours = event_log.focus_by_hour(since, until)
+        streaks = event_log.longest_streaks(since, until)
+    except sqlite3.Error as e:
+        report_text.insert(tk.END, f"Could not read the session history: {e}\n")
+        report_text.config(state='disabled')
+        return
+
+    focused = sum(row[1] for row in hours)
+    total = sum(row[2] for row in hours)
+    if total:
+        report_text.insert(tk.END, f"Focused {format_duration(focused)} of {format_duration(total)} tracked "
+                                   f"({focused / total:.0%}).\n\n")
+    report_text.insert(tk.END, "Distraction time by application:\n")
+    for app_title, time_spent in distractions:
+        report_text.insert(tk.END, f"  - {app_title}: {format_duration(time_spent)}\n")
+
+    report_text.insert(tk.END, "\nLongest focus streaks:\n")
+    for started, ended, seconds in streaks:
+        start_text = datetime.datetime.fromtimestamp(started).strftime('%a %d %b %H:%M')
+        report_text.insert(tk.END, f"  - {format_duration(seconds)} from {start_text}\n")
+
+    report_text.insert(tk.END, "\nFocus ratio by hour of day:\n")
+    by_hour = collections.defaultdict(lambda: [0.0, 0.0])
+    for hour, hour_focused, hour_total in hours:
+        totals = by_hour[datetime.datetime.fromtimestamp(hour).hour]
+        totals[0] += hour_focused
+        totals[1] += hour_total
+    for hour_of_day in sorted(by_hour):
+        hour_focused, hour_total = by_hour[hour_of_day]
+        report_text.insert(tk.END, f"  - {hour_of_day:02d}:00  {hour_focused / hour_total:.0%} "
+                                   f"of {format_duration(hour_total)}\n")
+    report_text.config(state='disabled') # Disable editing again
+
 def show_distraction_report():
     """Displays a detailed report of distraction time by application."""
-    global distraction_per_app
-    if not distraction_per_app:
+    distraction_per_app = tracking_state.snapshot.distraction_per_app
+    if not distraction_per_app and not event_log.has_data():
         messagebox.showinfo("No Data", "No distraction data was recorded.")
         return
 
@@ -397,9 +1761,9 @@ def show_distraction_report():
     report_frame.pack(fill=tk.BOTH, expand=True)
 
     ttk.Label(report_frame, text="Distraction Time by Application", font=('Helvetica', 16, 'bold')).pack(pady=5)
-    
-    # Sort the dictionary by distraction time in descending order
-    sorted_distractions = sorted(distraction_per_app.items(), key=lambda item: item[1], reverse=True)
+    range_var = tk.StringVar(value="This session" if distraction_per_app else "Today")
+    range_box = ttk.Combobox(report_frame, textvariable=range_var, values=list(REPORT_RANGES), state='readonly')
+    range_box.pack(pady=5)
     
     # Create a Text widget with a scrollbar
     report_text = tk.Text(report_frame, wrap=tk.WORD, font=('Helvetica', 12), state='disabled', height=20, width=60)
@@ -409,23 +1773,42 @@ def show_distraction_report():
     report_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
     report_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
     
-    report_text.config(state='normal') # Enable editing to insert text
-    report_text.insert(tk.END, "Apps are ranked by the total time spent distracted on them.\n\n")
+    range_box.bind('<<ComboboxSelected>>', lambda event: write_distraction_report(report_text, range_var.get()))
+    write_distraction_report(report_text, range_var.get())
 
-    for app_title, time_spent in sorted_distractions:
-        report_text.insert(tk.END, f"  - {app_title}: {time_spent:.2f} seconds\n")
-        
-    report_text.config(state='disabled') # Disable editing again
+def set_show_telemetry(value):
+    """Shows or hides the performance panel."""
+    global show_telemetry, shown_telemetry
+    show_telemetry = value
+    shown_telemetry = None
+    if value:
+        telemetry_label.config(text="Waiting for telemetry...")
+        telemetry_label.pack(pady=5, anchor='w')
+    else:
+        telemetry_label.pack_forget()
+
+def set_show_landmarks(value):
+    """Turns the face mesh overlay on the live video on or off."""
+    global show_landmarks
+    show_landmarks = value
+    for flag in engine_flags:
+        flag.value = value
 
 def on_closing():
     """Handles the window closing event to ensure cleanup."""
     if messagebox.askokcancel("Quit", "Do you want to quit the application?"):
-        stop_tracking_button_handler()
+        stop_event.set()
+        window_provider.stop()
+        # The tracking threads are daemons, so finish the session before the process exits
+        if webcam_thread is not None:
+            webcam_thread.join(timeout=WEBCAM_STOP_TIMEOUT)
+        event_log.end_session(time.time())
+        event_log.flush()
         root.destroy()
 
 def main():
     """The main function to set up and run the GUI."""
-    global root, video_label, app_listbox, start_button, stop_button, show_graph_button, refresh_button, status_label, focused_label, distraction_label, pomodoro_label, pomodoro_start_button, pomodoro_stop_button, pomodoro_pause_button, gamification_label, show_report_button
+    global root, video_label, app_listbox, start_button, stop_button, show_graph_button, refresh_button, status_label, focused_label, distraction_label, pomodoro_label, pomodoro_start_button, pomodoro_stop_button, pomodoro_pause_button, gamification_label, show_report_button, telemetry_label
     
     root = tk.Tk()
     root.title("AI Focus Tracker")
@@ -472,7 +1855,9 @@ def main():
     # Graph and Report buttons (Below the small buttons)
     show_graph_button = ttk.Button(app_selection_frame, text="Show Stats Graph", command=show_graph, state=tk.DISABLED)
     show_graph_button.grid(row=3, column=0, columnspan=1, pady=10, sticky='nsew')
-    show_report_button = ttk.Button(app_selection_frame, text="Show Distraction Report", command=show_distraction_report, state=tk.DISABLED)
+    # Reports can show earlier sessions, so the button starts enabled when there are any
+    show_report_button = ttk.Button(app_selection_frame, text="Show Distraction Report", command=show_distraction_report,
+                                    state=tk.NORMAL if event_log.has_data() else tk.DISABLED)
     show_report_button.grid(row=3, column=1, columnspan=1, pady=10, sticky='nsew')
 
     # Live Webcam Frame (Top-right)
@@ -515,8 +1900,18 @@ def main():
     distraction_label.pack(pady=5, anchor='w')
     gamification_label = ttk.Label(stats_frame, text="", font=('Helvetica', 14, 'bold'), foreground='blue')
     gamification_label.pack(pady=10, anchor='w')
+    show_landmarks_var = tk.BooleanVar(value=show_landmarks)
+    ttk.Checkbutton(stats_frame, text="Show face mesh", variable=show_landmarks_var,
+                    command=lambda: set_show_landmarks(show_landmarks_var.get())).pack(pady=5, anchor='w')
+    show_telemetry_var = tk.BooleanVar(value=show_telemetry)
+    ttk.Checkbutton(stats_frame, text="Show performance", variable=show_telemetry_var,
+                    command=lambda: set_show_telemetry(show_telemetry_var.get())).pack(pady=5, anchor='w')
+    telemetry_label = ttk.Label(stats_frame, text="", font=('Courier', 10), justify=tk.LEFT)
+    if show_telemetry:
+        set_show_telemetry(True)
     
     list_windows()
+    window_provider.start()
     update_gui()
     root.mainloop()
 
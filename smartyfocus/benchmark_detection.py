@@ -0,0 +1,97 @@
+"""
+Compares the face detection paths on recorded footage.
+
+    python benchmark_detection.py recording.mp4
+    python benchmark_detection.py recording.mp4 --frames 600 --modes mesh cascade
+
+Every mode runs inference on every frame so the numbers show the per-frame
+cost of the detector itself, not the savings from the inference scheduler.
+
+    mesh              FaceMesh on the whole frame (the original path)
+    mesh-roi          FaceMesh on a crop around the last face
+    cascade           face detection first, FaceMesh only for ambiguous frames
+    cascade-overlay   the cascade with the face mesh overlay on, so FaceMesh always runs
+"""
+import sys
+import time
+import argparse
+import statistics
+
+import cv2
+import mediapipe as mp
+
+import app as focus
+
+MODES = ('mesh', 'mesh-roi', 'cascade', 'cascade-overlay')
+
+def load_frames(path, limit):
+    """Reads up to `limit` frames of the video at `path`."""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        sys.exit(f"Cannot open {path}")
+    frames = []
+    while limit is None or len(frames) < limit:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+def run_mode(mode, frames):
+    """Runs one detection path over the frames; returns its latencies, CPU time and per-frame states."""
+    # Infinite rates make every frame due for inference
+    scheduler = focus.InferenceScheduler(target_fps=float('inf'), max_fps=float('inf'), min_fps=float('inf'))
+    with mp.solutions.face_mesh.FaceMesh(
+        max_num_faces=1,
+        refine_landmarks=True,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5) as face_mesh, \
+        mp.solutions.face_detection.FaceDetection(
+        model_selection=0,
+        min_detection_confidence=0.5) as face_detector:
+
+        tracker = focus.FaceTracker(
+            face_mesh, scheduler,
+            face_detector=face_detector if mode.startswith('cascade') else None,
+            roi_enabled=mode != 'mesh')
+        need_landmarks = mode != 'cascade'
+
+        latencies = []
+        states = []
+        cpu_start = time.process_time()
+        for frame in frames:
+            start = time.perf_counter()
+            tracker.update(frame, start, need_landmarks=need_landmarks)
+            latencies.append(time.perf_counter() - start)
+            states.append((tracker.face_detected, tracker.head_facing_forward))
+        cpu = time.process_time() - cpu_start
+    return latencies, cpu, states, tracker.mesh_runs
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the face detection paths on a recorded video.")
+    parser.add_argument('video', help="recorded webcam footage")
+    parser.add_argument('--frames', type=int, help="only use the first N frames")
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    frames = load_frames(args.video, args.frames)
+    if not frames:
+        sys.exit("The video has no frames")
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}")
+
+    baseline_states = None
+    for mode in args.modes:
+        latencies, cpu, states, mesh_runs = run_mode(mode, frames)
+        if baseline_states is None:
+            baseline_states = states
+        agreement = sum(a == b for a, b in zip(states, baseline_states)) / len(frames)
+        latencies.sort()
+        print(f"{mode:16} mean {statistics.mean(latencies) * 1000:6.1f} ms  "
+              f"p95 {latencies[int(0.95 * (len(latencies) - 1))] * 1000:6.1f} ms  "
+              f"cpu {cpu / len(frames) * 1000:6.1f} ms/frame  "
+              f"FaceMesh on {mesh_runs / len(frames):.0%} of frames  "
+              f"agrees with {args.modes[0]} on {agreement:.1%}")
+
+if __name__ == '__main__':
+    main()
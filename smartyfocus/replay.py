@@ -0,0 +1,232 @@
+"""
+Replays a recorded video through the tracking engine without a camera, a
+desktop or Tk, and reports how fast it ran and what it measured.
+
+    python replay.py recording.mp4
+    python replay.py recording.mp4 --windows windows.json --out run.json
+    python replay.py --compare baseline.json run.json
+
+The replay runs on the video's own clock (frame number / frame rate), so the
+same video, window script and settings always give the same focused and
+distracted totals. --compare fails if the totals differ or frames per second
+dropped by more than the threshold.
+
+The window script is a JSON list of [seconds, title] pairs: each title is the
+active window from that point of the video on. Without one, the window is
+"Replay Target" throughout. Titles listed with --targets (default: the first
+title of the script) count as focused applications.
+"""
+import os
+import sys
+import json
+import time
+import bisect
+import argparse
+import platform
+import threading
+import types
+
+import cv2
+
+import app as focus
+
+class ReplayGrabber:
+    """Stands in for FrameGrabber: hands over every frame of a video file in order, stamped with video time."""
+    def __init__(self, path, stop):
+        self.path = path
+        self.stop = stop
+        self.capture = None
+        self.fps = None
+        self.frames = 0
+
+    def open(self):
+        self.capture = cv2.VideoCapture(self.path)
+        if not self.capture.isOpened():
+            return False
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        return True
+
+    def read(self):
+        ret, frame = self.capture.read()
+        if not ret:
+            # End of the recording ends the replay
+            self.stop.set()
+            return None, None
+        captured_at = self.frames / self.fps
+        self.frames += 1
+        return frame, captured_at
+
+    def video_time(self):
+        return self.frames / self.fps if self.fps else 0.0
+
+    def stats(self):
+        return {'captured': self.frames, 'dropped': 0, 'delivered': self.frames,
+                'capture_fps': self.fps, 'last_frame_age': 0.0, 'mean_frame_age': 0.0}
+
+    def release(self):
+        if self.capture is not None:
+            self.capture.release()
+
+class WindowScript:
+    """Stands in for the active window provider with titles that change at scripted video times."""
+    def __init__(self, entries):
+        entries = sorted(entries) or [(0.0, "Replay Target")]
+        self.times = [float(t) for t, _ in entries]
+        self.titles = [title for _, title in entries]
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls([(t, title) for t, title in json.load(f)])
+
+    def title_at(self, t):
+        index = bisect.bisect_right(self.times, t) - 1
+        return self.titles[max(0, index)]
+
+def peak_memory():
+    """Returns the peak resident memory of this process in bytes, or None if it cannot be read."""
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', None) or info.rss
+    except ImportError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def replay(video, windows, targets, show_landmarks, preview_size):
+    """Runs the tracking engine over `video` and returns the measurements."""
+    focus.title_classifier = focus.title_classifier.with_targets(targets)
+    focus.tracking_state.reset(0.0, tracking_active=True)
+
+    stop = threading.Event()
+    grabber = ReplayGrabber(video, stop)
+    timings = {}
+    sink = focus.PreviewBuffer()
+    sink.set_size(*preview_size)
+    show_landmarks_flag = types.SimpleNamespace(value=show_landmarks)
+    focused_flag = types.SimpleNamespace(value=False)
+    inferences = 0
+
+    def account(now, face_state=None):
+        _, focused_flag.value = focus.account_focus(now, face_state, windows.title_at(now), timings)
+
+    def publish_state(message):
+        nonlocal inferences
+        if message[0] == 'face':
+            account(message[3], message[1:3])
+            inferences += 1
+        elif message[0] == 'error':
+            sys.exit(f"Cannot replay {video}: {message[1]}")
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    focus.tracking_engine(stop, publish_state, sink, show_landmarks_flag, focused_flag,
+                          grabber=grabber, clock=grabber.video_time, timings=timings)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    account(grabber.video_time())
+
+    frames = grabber.frames
+    totals = focus.tracking_state.snapshot
+    return {
+        'frames': frames,
+        'video_seconds': grabber.video_time(),
+        'wall_seconds': wall,
+        'cpu_seconds': cpu,
+        'frames_per_second': frames / wall if wall else 0.0,
+        'inferences': inferences,
+        'peak_memory_bytes': peak_memory(),
+        'stages': {
+            stage: {'count': count, 'total_ms': seconds * 1000, 'mean_ms': seconds * 1000 / count}
+            for stage, (count, seconds) in sorted(timings.items())
+        },
+        'totals': {
+            'focused_seconds': round(totals.focused_time, 3),
+            'distracted_seconds': round(totals.distracted_time, 3),
+            'distraction_per_app': {app: round(seconds, 3) for app, seconds in sorted(totals.distraction_per_app.items())},
+        },
+    }
+
+def compare(baseline_path, current_path, threshold):
+    """Exits with status 1 if the totals changed or frames per second fell by more than `threshold`."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    with open(current_path) as f:
+        current = json.load(f)['results']
+
+    failed = False
+    speed = current['frames_per_second'] / baseline['frames_per_second'] - 1
+    print(f"frames/s {baseline['frames_per_second']:.1f} -> {current['frames_per_second']:.1f} ({speed:+.1%})")
+    if speed < -threshold:
+        print("REGRESSION: slower than the baseline")
+        failed = True
+    for stage in sorted(baseline['stages'].keys() & current['stages'].keys()):
+        print(f"  {stage:16} {baseline['stages'][stage]['mean_ms']:7.2f} ms -> {current['stages'][stage]['mean_ms']:7.2f} ms")
+    if baseline['totals'] != current['totals']:
+        print("REGRESSION: the focused/distracted totals changed")
+        print(f"  baseline {json.dumps(baseline['totals'])}")
+        print(f"  current  {json.dumps(current['totals'])}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded video through the focus tracker.")
+    parser.add_argument('video', nargs='?', help="recorded webcam footage")
+    parser.add_argument('--windows', help="JSON window script of [seconds, title] pairs")
+    parser.add_argument('--targets', nargs='+', help="window titles that count as focused")
+    parser.add_argument('--landmarks', action='store_true', help="draw the face mesh, as with the overlay on")
+    parser.add_argument('--no-cascade', action='store_true', help="run FaceMesh without the face detection stage")
+    parser.add_argument('--no-roi', action='store_true', help="run FaceMesh on the whole frame")
+    parser.add_argument('--preview-size', default='640x360', help="preview size as WIDTHxHEIGHT")
+    parser.add_argument('--out', help="write the JSON results here instead of stdout")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help="compare two result files instead of replaying")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="relative frames/s drop counted as a regression (default 0.10)")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare[0], args.compare[1], args.threshold)
+        return
+    if not args.video:
+        parser.error("a video is required unless --compare is given")
+    if not os.path.exists(args.video):
+        parser.error(f"{args.video} does not exist")
+
+    focus.CASCADE_ENABLED = not args.no_cascade
+    focus.ROI_ENABLED = not args.no_roi
+    windows = WindowScript.load(args.windows) if args.windows else WindowScript([])
+    targets = args.targets or [windows.titles[0]]
+    width, height = (int(n) for n in args.preview_size.lower().split('x'))
+
+    results = replay(args.video, windows, targets, args.landmarks, (width, height))
+    report = {
+        'meta': {
+            'timestamp': time.time(),
+            'video': os.path.basename(args.video),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cascade': focus.CASCADE_ENABLED,
+            'roi': focus.ROI_ENABLED,
+            'landmarks': args.landmarks,
+        },
+        'results': results,
+    }
+    print(f"{results['frames']} frames in {results['wall_seconds']:.1f}s: {results['frames_per_second']:.1f} frames/s, "
+          f"focused {results['totals']['focused_seconds']:.1f}s, distracted {results['totals']['distracted_seconds']:.1f}s",
+          file=sys.stderr)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()